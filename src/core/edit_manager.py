@@ -39,6 +39,7 @@ class EditManager:
             
             # Obter estado atual do PIG
             pig_state = await self.pig_manager.get_graph_state(session_id)
+            version_history = await self.pig_manager.get_version_history_summary(session_id)
             
             # Preparar dados para edição
             edit_data = {
@@ -48,13 +49,13 @@ class EditManager:
                 "operations": pig_state.get('operations', []),
                 "editable_code": load_result.get('cadquery_code', ''),
                 "metadata": load_result.get('metadata', {}),
-                "version_history": pig_state.get('version_history', []),
+                "version_history": version_history,
                 "load_timestamp": datetime.now().isoformat(),
                 "edit_capabilities": {
                     "can_edit_parameters": True,
                     "can_edit_code": True,
                     "can_create_checkpoints": True,
-                    "can_rollback": len(pig_state.get('version_history', [])) > 0
+                    "can_rollback": len(version_history) > 0
                 }
             }
             
@@ -302,7 +303,7 @@ class EditManager:
             
             # Validar código se fornecido
             if edited_code:
-                code_validation = await self.pig_manager._validate_cadquery_code(edited_code)
+                code_validation = self.pig_manager._validate_cadquery_code(edited_code)
                 validation_results.append({
                     "type": "code",
                     "is_valid": code_validation.get('is_valid'),
@@ -14,7 +14,7 @@ import ast
 
 from ..models import (
     ExecutionPlan, ExecutionResult, ASTNode, ASTNodeType, 
-    ParametricIntentionGraph
+    ParametricIntentionGraph, NodeType
 )
 
 logger = logging.getLogger(__name__)
@@ -386,9 +386,9 @@ except Exception as e:
         for node_id in ordered_nodes:
             node = pig.nodes[node_id]
             
-            if node.node_type.value == "parameter":
+            if node.node_type == NodeType.PARAMETER:
                 parameters[node.name] = node.value
-            elif node.node_type.value == "operation":
+            elif node.node_type == NodeType.OPERATION:
                 operations.append(node)
         
         # Gerar código - SEMPRE COM INDENTAÇÃO CORRETA
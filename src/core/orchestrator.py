@@ -328,6 +328,7 @@ class CentralOrchestrator:
         conversation = await self.dialog_manager.get_conversation_history(session_id)
         model_state = await self.dialog_manager.get_model_state(session_id)
         pig_state = await self.pig_manager.get_graph_state(session_id)
+        version_history = await self.pig_manager.get_version_history(session_id)
         
         return {
             "session_id": session_id,
@@ -341,7 +342,7 @@ class CentralOrchestrator:
                 "can_edit_code": True,
                 "can_edit_parameters": True,
                 "can_create_checkpoints": True,
-                "has_version_history": len(pig_state.get('version_history', [])) > 0
+                "has_version_history": len(version_history) > 0
             }
         }
     
@@ -1,18 +1,155 @@
 import asyncio
+import ast
+import functools
+import hashlib
+import io
+import itertools
 import logging
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
+from enum import Enum
 from pathlib import Path
 import re
 import json
+import string
+import time
 
 from ..models import (
     ParametricIntentionGraph, PIGNode, ParameterNode, OperationNode,
-    NodeType, ParameterType, ExecutionPlan, ExecutionResult
+    NodeType, ParameterType, ExecutionPlan, ExecutionResult, new_id
 )
 
 logger = logging.getLogger(__name__)
 
+# A cada N checkpoints grava-se um snapshot completo, limitando a cadeia de deltas no rollback
+CHECKPOINT_FULL_SNAPSHOT_INTERVAL = 20
+
+# Quantidade máxima de registros mantidos no histórico de versões de cada sessão
+VERSION_HISTORY_MAX_ENTRIES = 100
+
+# Quantidade máxima de códigos com validação/detecção de parâmetros em cache
+CODE_ANALYSIS_CACHE_SIZE = 256
+
+# Templates básicos de código CadQuery para nós AST
+_TEMPLATES: Dict[str, str] = {
+    "box": "result = cq.Workplane('XY').box({width}, {height}, {depth})",
+    "cylinder": "result = cq.Workplane('XY').cylinder({height}, {radius})",
+    "sphere": "result = cq.Workplane('XY').sphere({radius})",
+    "extrude": "result = result.extrude({distance})",
+    "cut": "result = result.cut({cutter})",
+    "fillet": "result = result.fillet({radius})"
+}
+
+# Campos exigidos por cada template, extraídos uma única vez na importação
+_TEMPLATE_FIELDS: Dict[str, tuple] = {
+    operation: tuple(field for _, field, _, _ in string.Formatter().parse(template) if field)
+    for operation, template in _TEMPLATES.items()
+}
+
+# Padrões compilados uma única vez e reutilizados por todos os carregamentos
+_PARAM_RE = re.compile(r'^\s*(\w+)\s*=\s*(.+?)(?:\s*#.*)?$')
+_VAR_RE = re.compile(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\b')
+
+# Classificadores dos literais mais comuns, evitando ast.literal_eval e exceções
+_INT_LITERAL_RE = re.compile(r'-?\d+')
+_FLOAT_LITERAL_RE = re.compile(r'-?(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?|-?\d+[eE][+-]?\d+')
+_BOOL_LITERALS = {'True': True, 'False': False}
+# Erros possíveis de ast.literal_eval em Python válido (ex.: {[1]: 2} gera TypeError)
+_LITERAL_EVAL_ERRORS = (ValueError, SyntaxError, TypeError, MemoryError, RecursionError)
+
+# Marcadores verificados na validação do código CadQuery, buscados em uma única varredura
+_VALIDATION_MARKERS_RE = re.compile(r'import cadquery as cq|cq\.|result')
+_ALL_VALIDATION_MARKERS = frozenset({'import cadquery as cq', 'cq.', 'result'})
+
+# Palavras-chave do CadQuery e Python que não são parâmetros
+_EXCLUDED_WORDS = frozenset({
+    'cq', 'result', 'Workplane', 'box', 'cylinder', 'sphere', 'extrude', 
+    'cut', 'union', 'fillet', 'chamfer', 'faces', 'edges', 'vertices',
+    'XY', 'XZ', 'YZ', 'import', 'as', 'from', 'def', 'class', 'if', 
+    'else', 'elif', 'for', 'while', 'try', 'except', 'finally',
+    'and', 'or', 'not', 'in', 'is', 'True', 'False', 'None'
+})
+
+# Inferência de tipo pelo nome da variável: grupos em ordem de prioridade
+_INFER_GROUPS = (
+    (('width', 'height', 'depth', 'length', 'size', 'radius', 'diameter'), ParameterType.NUMERIC, 10.0),
+    (('count', 'number', 'num'), ParameterType.NUMERIC, 4),
+    (('angle', 'rotation'), ParameterType.NUMERIC, 90.0),
+    (('enable', 'show', 'visible'), ParameterType.BOOLEAN, True),
+    (('name', 'label', 'text'), ParameterType.STRING, "Parameter"),
+)
+
+# Palavra-chave -> (prioridade, tipo, valor padrão)
+_KEYWORD_TYPE: Dict[str, Tuple[int, ParameterType, Any]] = {
+    keyword: (priority, param_type, default)
+    for priority, (keywords, param_type, default) in enumerate(_INFER_GROUPS)
+    for keyword in keywords
+}
+
+# Lookahead captura ocorrências sobrepostas de todas as palavras-chave em uma única passada
+_INFER_RE = re.compile(
+    '(?=(' + '|'.join(sorted(_KEYWORD_TYPE, key=len, reverse=True)) + '))'
+)
+
+@functools.lru_cache(maxsize=1024)
+def _infer_type_from_name(var_name_lower: str) -> Tuple[ParameterType, Any]:
+    """Inferência por nome em minúsculas (memoizada: os mesmos identificadores se repetem entre códigos)"""
+    # Vence a palavra-chave do grupo de maior prioridade
+    matches = _INFER_RE.findall(var_name_lower)
+    if matches:
+        _, param_type, default_value = min(_KEYWORD_TYPE[keyword] for keyword in matches)
+        return param_type, default_value
+    
+    return ParameterType.NUMERIC, 10.0
+
+def _validate_numeric(param_node: ParameterNode, new_value: Any) -> Dict[str, Any]:
+    """Valida valor numérico e limites definidos no parâmetro"""
+    if not isinstance(new_value, (int, float)):
+        return {"is_valid": False, "error": "Valor deve ser numérico"}
+    
+    # Verificar limites se definidos
+    if param_node.min_value is not None and new_value < param_node.min_value:
+        return {"is_valid": False, "error": f"Valor deve ser >= {param_node.min_value}"}
+    
+    if param_node.max_value is not None and new_value > param_node.max_value:
+        return {"is_valid": False, "error": f"Valor deve ser <= {param_node.max_value}"}
+    
+    return {"is_valid": True}
+
+def _validate_boolean(param_node: ParameterNode, new_value: Any) -> Dict[str, Any]:
+    """Valida valor booleano"""
+    if not isinstance(new_value, bool):
+        return {"is_valid": False, "error": "Valor deve ser booleano"}
+    return {"is_valid": True}
+
+def _validate_string(param_node: ParameterNode, new_value: Any) -> Dict[str, Any]:
+    """Valida valor string"""
+    if not isinstance(new_value, str):
+        return {"is_valid": False, "error": "Valor deve ser string"}
+    return {"is_valid": True}
+
+# Validador de valor por tipo de parâmetro
+_VALUE_VALIDATORS = {
+    ParameterType.NUMERIC: _validate_numeric,
+    ParameterType.BOOLEAN: _validate_boolean,
+    ParameterType.STRING: _validate_string,
+}
+
+# Marcadores das seções do código gerado (varredura sem ast)
+_OPERATIONS_MARKERS = ('# Operações', 'Operations')
+_OPERATIONS_END_MARKERS = ('# Extrair informações', "if 'result' in locals():")
+
+def _find_first(text: str, needles: Tuple[str, ...], start: int = 0) -> int:
+    """Posição da primeira ocorrência de qualquer um dos trechos (-1 se nenhum)"""
+    positions = [pos for pos in (text.find(needle, start) for needle in needles) if pos != -1]
+    return min(positions) if positions else -1
+
+class _CodeSection(Enum):
+    """Seção corrente na varredura linha a linha do código gerado"""
+    NONE = "none"
+    PARAMS = "params"
+
 class PIGManager:
     """
     Gerenciador do Grafo de Intenção Paramétrica (PIG).
@@ -23,19 +160,50 @@ class PIGManager:
         # Armazenamento em memória (em produção, usar persistência)
         self.graphs: Dict[str, ParametricIntentionGraph] = {}
         # Histórico de versões para cada sessão
-        self.version_history: Dict[str, List[Dict[str, Any]]] = {}
+        self.version_history: Dict[str, deque] = defaultdict(
+            lambda: deque(maxlen=VERSION_HISTORY_MAX_ENTRIES)
+        )
         # Cache de códigos gerados
         self.generated_code_cache: Dict[str, str] = {}
+        # Cache LRU de análise de código (validação e parâmetros detectados) por hash do código
+        self._code_analysis_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         
         # Diretório de códigos gerados (compartilhado com SandboxedExecutor)
         self.generated_code_dir = Path("generated_codes")
         
+        # Checkpoints são persistidos em disco como deltas; em memória ficam só os metadados
+        self.checkpoint_dir = self.generated_code_dir / "checkpoints"
+        # Revisão de cada nó no último checkpoint da sessão (base do delta)
+        self._checkpoint_node_revs: Dict[str, Dict[str, int]] = {}
+        # Último checkpoint gravado e quantos deltas existem desde o último snapshot completo
+        self._last_checkpoint: Dict[str, Optional[str]] = {}
+        self._checkpoint_chain_length: Dict[str, int] = {}
+        # Arquivos de checkpoint em disco por sessão: checkpoint_id -> checkpoint base do delta
+        self._checkpoint_files: Dict[str, Dict[str, Optional[str]]] = {}
+        # Locks por sessão: serializam escritores da mesma sessão sem bloquear outras sessões
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        # Índice session_id -> checkpoint_id -> entrada do histórico (lookup O(1) no rollback)
+        self._checkpoint_index: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        
     async def initialize_empty_graph(self, session_id: str):
         """Inicializa PIG vazio para uma nova sessão"""
         self.graphs[session_id] = ParametricIntentionGraph()
-        self.version_history[session_id] = []
+        self.version_history[session_id] = deque(maxlen=VERSION_HISTORY_MAX_ENTRIES)
+        self._checkpoint_node_revs.pop(session_id, None)
+        self._last_checkpoint.pop(session_id, None)
+        self._checkpoint_chain_length.pop(session_id, None)
+        self._checkpoint_index[session_id] = {}
+        # Checkpoints da sessão anterior deixam de ser alcançáveis
+        await self._delete_orphan_checkpoints(session_id)
         logger.info(f"PIG inicializado para sessão {session_id}")
     
+    def _get_session_lock(self, session_id: str) -> asyncio.Lock:
+        """Retorna o lock de escrita da sessão"""
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+    
     async def get_graph(self, session_id: str) -> ParametricIntentionGraph:
         """Retorna o PIG da sessão"""
         if session_id not in self.graphs:
@@ -48,11 +216,10 @@ class PIGManager:
         
         return {
             "nodes": {node_id: self._serialize_node(node) for node_id, node in pig.nodes.items()},
-            "execution_order": pig.execution_order,
+            "execution_order": pig.get_execution_order(),
             "root_nodes": list(pig.root_nodes),
             "parameters": self._extract_parameters(pig),
             "operations": self._extract_operations(pig),
-            "version_history": self.version_history.get(session_id, []),
             "latest_generated_file": await self._get_latest_generated_file(session_id)
         }
     
@@ -63,25 +230,39 @@ class PIGManager:
         Atualiza PIG baseado no plano de execução e resultado.
         Adiciona novos parâmetros e operações ao grafo.
         """
-        pig = await self.get_graph(session_id)
-        
-        try:
-            # 1. Adicionar novos parâmetros
-            for param_name, param_value in plan.new_parameters.items():
-                await self._add_parameter_to_pig(pig, param_name, param_value)
-            
-            # 2. Adicionar operações do AST
-            for ast_node in plan.ast_nodes:
-                await self._add_ast_node_to_pig(pig, ast_node, plan.new_parameters)
-            
-            # 3. Recalcular ordem de execução
-            pig.get_execution_order()
-            
-            logger.info(f"PIG atualizado com {len(plan.ast_nodes)} nós para sessão {session_id}")
+        async with self._get_session_lock(session_id):
+            pig = await self.get_graph(session_id)
             
-        except Exception as e:
-            logger.error(f"Erro ao atualizar PIG: {e}")
-            raise
+            try:
+                new_nodes: List[PIGNode] = []
+                edges: List[Tuple[str, str]] = []
+                
+                # 1. Coletar novos parâmetros (existentes são atualizados no lugar)
+                param_ids = {
+                    param_name: self._add_parameter_to_pig(pig, param_name, param_value, new_nodes)
+                    for param_name, param_value in plan.new_parameters.items()
+                }
+                
+                # 2. Coletar operações do AST e dependências para parâmetros referenciados
+                for ast_node in plan.ast_nodes:
+                    operation_node = self._build_operation_from_ast(ast_node, plan.new_parameters)
+                    if operation_node is None:
+                        continue
+                    new_nodes.append(operation_node)
+                    for param_name in ast_node.parameters.values():
+                        if isinstance(param_name, str) and param_name in param_ids:
+                            edges.append((operation_node.id, param_ids[param_name]))
+                
+                # 3. Inserir nós e arestas em lote e recalcular ordem de execução uma única vez
+                pig.add_nodes(new_nodes)
+                pig.add_dependencies_bulk(edges)
+                pig.get_execution_order()
+                
+                logger.info(f"PIG atualizado com {len(plan.ast_nodes)} nós para sessão {session_id}")
+                
+            except Exception as e:
+                logger.error(f"Erro ao atualizar PIG: {e}")
+                raise
     
     async def add_parameter(
         self, 
@@ -108,7 +289,7 @@ class PIGManager:
         )
         
         node_id = pig.add_node(param_node)
-        logger.debug(f"Parâmetro '{name}' adicionado ao PIG: {node_id}")
+        logger.debug("Parâmetro '%s' adicionado ao PIG: %s", name, node_id)
         return node_id
     
     async def add_operation(
@@ -140,7 +321,7 @@ class PIGManager:
                 if param_node_id in pig.nodes:
                     pig.add_dependency(node_id, param_node_id)
         
-        logger.debug(f"Operação '{name}' adicionada ao PIG: {node_id}")
+        logger.debug("Operação '%s' adicionada ao PIG: %s", name, node_id)
         return node_id
     
     async def update_parameter_value(
@@ -161,8 +342,8 @@ class PIGManager:
         affected_nodes = pig.update_parameter(param_id, new_value)
         
         logger.info(
-            f"Parâmetro '{parameter_name}' atualizado para {new_value}. "
-            f"Nós afetados: {len(affected_nodes)}"
+            "Parâmetro '%s' atualizado para %s. Nós afetados: %d",
+            parameter_name, new_value, len(affected_nodes)
         )
         
         return affected_nodes
@@ -202,33 +383,21 @@ class PIGManager:
         }
     
     def _serialize_node(self, node: PIGNode) -> Dict[str, Any]:
-        """Serializa nó do PIG para JSON"""
-        base_data = {
-            "id": node.id,
-            "name": node.name,
-            "node_type": node.node_type.value,
-            "value": node.value,
-            "description": node.description,
-            "dependencies": list(node.dependencies),
-            "dependents": list(node.dependents),
-            "metadata": node.metadata
-        }
+        """Serializa nó do PIG para JSON (resultado em cache por revisão do nó; não modificar)"""
+        cached = node._serialized
+        if cached is not None and cached[0] == node._rev:
+            return cached[1]
         
-        # Adicionar campos específicos do tipo
-        if isinstance(node, ParameterNode):
-            base_data.update({
-                "parameter_type": node.parameter_type.value,
-                "min_value": node.min_value,
-                "max_value": node.max_value,
-                "units": node.units
-            })
-        elif isinstance(node, OperationNode):
-            base_data.update({
-                "operation_type": node.operation_type,
-                "cadquery_code": node.cadquery_code,
-                "inputs": node.inputs
-            })
+        # Campos definidos por classe (sem despacho por isinstance); enums viram seus valores
+        base_data = {}
+        for field in node._SER_FIELDS:
+            value = getattr(node, field)
+            base_data[field] = value.value if isinstance(value, Enum) else value
+        base_data["dependencies"] = list(node.dependencies)
+        base_data["dependents"] = list(node.dependents)
+        base_data["metadata"] = node.metadata
         
+        node._serialized = (node._rev, base_data)
         return base_data
     
     def _extract_parameters(self, pig: ParametricIntentionGraph) -> Dict[str, Any]:
@@ -251,9 +420,7 @@ class PIGManager:
         """Extrai apenas as operações do PIG"""
         operations = []
         
-        execution_order = pig.get_execution_order()
-        
-        for node_id in execution_order:
+        for node_id in pig.get_execution_order():
             node = pig.nodes[node_id]
             if node.node_type == NodeType.OPERATION:
                 operations.append({
@@ -267,8 +434,14 @@ class PIGManager:
         
         return operations
     
-    async def _add_parameter_to_pig(self, pig: ParametricIntentionGraph, name: str, value: Any):
-        """Adiciona parâmetro ao PIG (método interno)"""
+    def _add_parameter_to_pig(
+        self, pig: ParametricIntentionGraph, name: str, value: Any,
+        pending_nodes: Optional[List[PIGNode]] = None
+    ) -> str:
+        """
+        Adiciona parâmetro ao PIG (método interno) e retorna seu ID.
+        Se pending_nodes for informado, o novo nó é acumulado na lista para inserção em lote.
+        """
         
         # Determinar tipo do parâmetro baseado no valor
         if isinstance(value, (int, float)):
@@ -287,40 +460,35 @@ class PIGManager:
         if existing_id:
             # Atualizar valor existente
             pig.nodes[existing_id].value = value
-        else:
-            # Criar novo parâmetro
-            param_node = ParameterNode(
-                name=name,
-                value=value,
-                parameter_type=param_type
-            )
-            pig.add_node(param_node)
+            return existing_id
+        
+        # Criar novo parâmetro
+        param_node = ParameterNode(
+            name=name,
+            value=value,
+            parameter_type=param_type
+        )
+        if pending_nodes is not None:
+            pending_nodes.append(param_node)
+            return param_node.id
+        return pig.add_node(param_node)
     
-    async def _add_ast_node_to_pig(
-        self, pig: ParametricIntentionGraph, ast_node, parameters: Dict[str, Any]
-    ):
-        """Converte nó AST para nó do PIG"""
-        
-        if ast_node.node_type.value in ["primitive", "operation"]:
-            # Gerar código CadQuery para este nó
-            cadquery_code = self._generate_cadquery_code_for_node(ast_node, parameters)
-            
-            operation_node = OperationNode(
-                name=f"{ast_node.operation}_{ast_node.id[:8]}",
-                value=None,  # OperationNode usa valor nulo
-                operation_type=ast_node.operation or "unknown",
-                cadquery_code=cadquery_code,
-                inputs=self._extract_parameter_references(ast_node, parameters)
-            )
-            
-            node_id = pig.add_node(operation_node)
-            
-            # Adicionar dependências para parâmetros referenciados
-            for param_name in ast_node.parameters.values():
-                if isinstance(param_name, str) and param_name in parameters:
-                    param_id = pig.find_parameter_by_name(param_name)
-                    if param_id:
-                        pig.add_dependency(node_id, param_id)
+    def _build_operation_from_ast(self, ast_node, parameters: Dict[str, Any]) -> Optional[OperationNode]:
+        """Converte nó AST para nó de operação do PIG (sem inseri-lo no grafo)"""
+        
+        if ast_node.node_type.value not in ["primitive", "operation"]:
+            return None
+        
+        # Gerar código CadQuery para este nó
+        cadquery_code = self._generate_cadquery_code_for_node(ast_node, parameters)
+        
+        return OperationNode(
+            name=f"{ast_node.operation}_{ast_node.id[:8]}",
+            value=None,  # OperationNode usa valor nulo
+            operation_type=ast_node.operation or "unknown",
+            cadquery_code=cadquery_code,
+            inputs=self._extract_parameter_references(ast_node, parameters)
+        )
     
     def _generate_cadquery_code_for_node(self, ast_node, parameters: Dict[str, Any]) -> str:
         """Gera código CadQuery para um nó AST"""
@@ -328,23 +496,15 @@ class PIGManager:
         operation = ast_node.operation
         params = ast_node.parameters
         
-        # Templates básicos de código
-        templates = {
-            "box": "result = cq.Workplane('XY').box({width}, {height}, {depth})",
-            "cylinder": "result = cq.Workplane('XY').cylinder({height}, {radius})",
-            "sphere": "result = cq.Workplane('XY').sphere({radius})",
-            "extrude": "result = result.extrude({distance})",
-            "cut": "result = result.cut({cutter})",
-            "fillet": "result = result.fillet({radius})"
-        }
-        
-        if operation in templates:
-            try:
-                return templates[operation].format(**params)
-            except KeyError as e:
-                return f"# ERRO: Parâmetro ausente {e} para operação {operation}"
-        else:
+        template = _TEMPLATES.get(operation)
+        if template is None:
             return f"# ERRO: Template não encontrado para operação {operation}"
+        
+        missing = [field for field in _TEMPLATE_FIELDS[operation] if field not in params]
+        if missing:
+            return f"# ERRO: Parâmetro ausente '{missing[0]}' para operação {operation}"
+        
+        return template.format_map(params)
     
     def _extract_parameter_references(self, ast_node, parameters: Dict[str, Any]) -> Dict[str, str]:
         """Extrai referências a parâmetros de um nó AST"""
@@ -381,11 +541,13 @@ class PIGManager:
             with open(file_path, 'r', encoding='utf-8') as f:
                 full_code = f.read()
             
-            # Extrair parâmetros do código
-            parameters = await self._extract_parameters_from_code(full_code)
-            
-            # Extrair operações CadQuery
-            cadquery_code = await self._extract_cadquery_operations(full_code)
+            # Extrair parâmetros e operações com um único parse do código
+            sections = self._parse_generated_code(full_code)
+            if sections is not None:
+                parameters, cadquery_code = sections
+            else:
+                # Código com erro de sintaxe: usar varredura linha a linha
+                parameters, cadquery_code = self._parse_code_sections(full_code)
             
             # Atualizar PIG com os dados carregados
             await self._update_pig_from_loaded_data(session_id, parameters, cadquery_code, metadata)
@@ -427,80 +589,89 @@ class PIGManager:
         Returns:
             Resultado da edição incluindo nós afetados
         """
-        try:
-            pig = await self.get_graph(session_id)
-            
-            if operation_id not in pig.nodes:
-                raise ValueError(f"Operação {operation_id} não encontrada")
-            
-            node = pig.nodes[operation_id]
-            if node.node_type != NodeType.OPERATION:
-                raise ValueError(f"Nó {operation_id} não é uma operação")
-            
-            # Salvar estado anterior para rollback
-            previous_code = getattr(node, 'cadquery_code', '')
-            
-            # Validar novo código
-            validation_result = await self._validate_cadquery_code(new_cadquery_code)
-            if not validation_result['is_valid']:
+        async with self._get_session_lock(session_id):
+            try:
+                pig = await self.get_graph(session_id)
+                
+                if operation_id not in pig.nodes:
+                    raise ValueError(f"Operação {operation_id} não encontrada")
+                
+                node = pig.nodes[operation_id]
+                if node.node_type != NodeType.OPERATION:
+                    raise ValueError(f"Nó {operation_id} não é uma operação")
+                
+                # Salvar estado anterior para rollback
+                previous_code = getattr(node, 'cadquery_code', '')
+                
+                # Validar novo código
+                validation_result = self._validate_cadquery_code(new_cadquery_code)
+                if not validation_result['is_valid']:
+                    return {
+                        "success": False,
+                        "error": f"Código inválido: {validation_result['error']}",
+                        "validation_details": validation_result
+                    }
+                
+                # Atualizar código da operação
+                node.cadquery_code = new_cadquery_code
+                
+                # Detectar novos parâmetros no código
+                try:
+                    new_parameters = self._detect_parameters_in_code(new_cadquery_code)
+                except Exception as e:
+                    logger.error(f"Erro ao detectar parâmetros: {e}")
+                    new_parameters = {}
+                
+                # Adicionar novos parâmetros ao PIG se necessário
+                for param_name, param_info in new_parameters.items():
+                    if not pig.find_parameter_by_name(param_name):
+                        await self.add_parameter(
+                            session_id, 
+                            param_name, 
+                            param_info['default_value'],
+                            param_info['type'],
+                            f"Detectado automaticamente do código editado"
+                        )
+                
+                # Recalcular dependências
+                affected_nodes = await self._recalculate_dependencies(session_id, operation_id)
+                
+                # Adicionar ao histórico de versões
+                edit_data = {
+                    "operation_id": operation_id,
+                    "previous_code": previous_code,
+                    "new_code": new_cadquery_code,
+                    "new_parameters": new_parameters,
+                    "affected_nodes": affected_nodes
+                }
+                await self._add_version_to_history(session_id, "direct_edit", edit_data)
+                
+                logger.info(f"Código editado diretamente para operação {operation_id}")
+                
+                return {
+                    "success": True,
+                    "operation_id": operation_id,
+                    "affected_nodes": affected_nodes,
+                    "new_parameters": new_parameters,
+                    "validation_result": validation_result
+                }
+                
+            except Exception as e:
+                logger.error(f"Erro na edição direta do código: {e}")
                 return {
                     "success": False,
-                    "error": f"Código inválido: {validation_result['error']}",
-                    "validation_details": validation_result
+                    "error": str(e),
+                    "operation_id": operation_id
                 }
-            
-            # Atualizar código da operação
-            node.cadquery_code = new_cadquery_code
-            
-            # Detectar novos parâmetros no código
-            new_parameters = await self._detect_parameters_in_code(new_cadquery_code)
-            
-            # Adicionar novos parâmetros ao PIG se necessário
-            for param_name, param_info in new_parameters.items():
-                if not pig.find_parameter_by_name(param_name):
-                    await self.add_parameter(
-                        session_id, 
-                        param_name, 
-                        param_info['default_value'],
-                        param_info['type'],
-                        f"Detectado automaticamente do código editado"
-                    )
-            
-            # Recalcular dependências
-            affected_nodes = await self._recalculate_dependencies(session_id, operation_id)
-            
-            # Adicionar ao histórico de versões
-            edit_data = {
-                "operation_id": operation_id,
-                "previous_code": previous_code,
-                "new_code": new_cadquery_code,
-                "new_parameters": new_parameters,
-                "affected_nodes": affected_nodes
-            }
-            await self._add_version_to_history(session_id, "direct_edit", edit_data)
-            
-            logger.info(f"Código editado diretamente para operação {operation_id}")
-            
-            return {
-                "success": True,
-                "operation_id": operation_id,
-                "affected_nodes": affected_nodes,
-                "new_parameters": new_parameters,
-                "validation_result": validation_result
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro na edição direta do código: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "operation_id": operation_id
-            }
     
     async def create_version_checkpoint(self, session_id: str, description: str = None) -> str:
         """
         Version Control: Cria um checkpoint de versão
         
+        O estado do PIG é gravado em disco como delta em relação ao checkpoint
+        anterior (apenas nós cuja serialização mudou); o histórico em memória
+        guarda somente os metadados do checkpoint.
+        
         Args:
             session_id: ID da sessão
             description: Descrição do checkpoint
@@ -508,32 +679,87 @@ class PIGManager:
         Returns:
             ID do checkpoint criado
         """
+        async with self._get_session_lock(session_id):
+            return await self._create_version_checkpoint(session_id, description)
+    
+    async def _create_version_checkpoint(self, session_id: str, description: str = None) -> str:
+        """Cria checkpoint sem adquirir o lock da sessão (chamador já o detém)"""
         try:
             pig = await self.get_graph(session_id)
             
             # Gerar timestamp único para o checkpoint
-            checkpoint_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            now = datetime.now()
+            checkpoint_id = now.strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            timestamp = now.isoformat()
+            
+            # Garantir ID único quando dois checkpoints caem no mesmo milissegundo
+            session_index = self._checkpoint_index.get(session_id, {})
+            if checkpoint_id in session_index or checkpoint_id == self._last_checkpoint.get(session_id):
+                suffix = 1
+                while f"{checkpoint_id}_{suffix}" in session_index:
+                    suffix += 1
+                checkpoint_id = f"{checkpoint_id}_{suffix}"
+            
+            # Revisões atuais dos nós: apenas nós com revisão diferente entram no delta
+            node_revs = {node_id: node._rev for node_id, node in pig.nodes.items()}
+            
+            base_id = self._last_checkpoint.get(session_id)
+            chain_length = self._checkpoint_chain_length.get(session_id, 0)
+            if base_id is None or chain_length >= CHECKPOINT_FULL_SNAPSHOT_INTERVAL:
+                # Snapshot completo
+                base_id = None
+                previous_revs = {}
+                chain_length = 0
+            else:
+                previous_revs = self._checkpoint_node_revs.get(session_id, {})
+                chain_length += 1
+            
+            # Serializar somente nós alterados (os demais são compartilhados com a base)
+            changed_nodes = {
+                node_id: self._serialize_node(pig.nodes[node_id])
+                for node_id, rev in node_revs.items()
+                if previous_revs.get(node_id) != rev
+            }
+            removed_nodes = [node_id for node_id in previous_revs if node_id not in node_revs]
             
-            # Serializar estado completo do PIG
             checkpoint_data = {
                 "checkpoint_id": checkpoint_id,
-                "description": description or f"Checkpoint automático - {datetime.now().isoformat()}",
-                "timestamp": datetime.now().isoformat(),
-                "pig_state": await self.get_graph_state(session_id),
-                "parameters": self._extract_parameters(pig),
-                "operations": self._extract_operations(pig)
+                "description": description or f"Checkpoint automático - {timestamp}",
+                "timestamp": timestamp
             }
+            payload = {
+                **checkpoint_data,
+                "base_checkpoint": base_id,
+                "nodes": changed_nodes,
+                "removed_nodes": removed_nodes,
+                "execution_order": pig.get_execution_order()
+            }
+            
+            # Persistir payload fora do event loop
+            checkpoint_path = self._get_checkpoint_path(session_id, checkpoint_id)
+            await asyncio.to_thread(
+                self._write_checkpoint_file,
+                checkpoint_path,
+                json.dumps(payload, ensure_ascii=False, default=str)
+            )
             
-            # Salvar checkpoint no histórico
-            if session_id not in self.version_history:
-                self.version_history[session_id] = []
+            self._checkpoint_node_revs[session_id] = node_revs
+            self._last_checkpoint[session_id] = checkpoint_id
+            self._checkpoint_chain_length[session_id] = chain_length
+            self._checkpoint_files.setdefault(session_id, {})[checkpoint_id] = base_id
             
-            self.version_history[session_id].append({
+            # Salvar apenas metadados do checkpoint no histórico
+            entry = {
                 "type": "checkpoint",
                 "data": checkpoint_data
-            })
+            }
+            await self._append_history_entry(session_id, entry)
+            self._checkpoint_index.setdefault(session_id, {})[checkpoint_id] = entry
             
-            logger.info(f"Checkpoint criado: {checkpoint_id} para sessão {session_id}")
+            logger.info(
+                "Checkpoint criado: %s para sessão %s (%d nós alterados, base: %s)",
+                checkpoint_id, session_id, len(changed_nodes), base_id or 'completo'
+            )
             return checkpoint_id
             
         except Exception as e:
@@ -551,52 +777,63 @@ class PIGManager:
         Returns:
             Resultado do rollback
         """
-        try:
-            if session_id not in self.version_history:
-                raise ValueError(f"Nenhum histórico encontrado para sessão {session_id}")
-            
-            # Encontrar checkpoint
-            checkpoint = None
-            for entry in self.version_history[session_id]:
-                if (entry.get('type') == 'checkpoint' and 
-                    entry.get('data', {}).get('checkpoint_id') == checkpoint_id):
-                    checkpoint = entry['data']
-                    break
-            
-            if not checkpoint:
-                raise ValueError(f"Checkpoint {checkpoint_id} não encontrado")
-            
-            # Criar checkpoint atual antes do rollback
-            current_checkpoint = await self.create_version_checkpoint(
-                session_id, f"Backup antes do rollback para {checkpoint_id}"
-            )
-            
-            # Restaurar estado do PIG
-            await self._restore_pig_from_checkpoint(session_id, checkpoint)
-            
-            logger.info(f"Rollback realizado para checkpoint {checkpoint_id}")
-            
-            return {
-                "success": True,
-                "rolled_back_to": checkpoint_id,
-                "backup_checkpoint": current_checkpoint,
-                "restored_parameters": checkpoint.get('parameters', {}),
-                "restored_operations": len(checkpoint.get('operations', []))
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro no rollback: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "checkpoint_id": checkpoint_id
-            }
+        async with self._get_session_lock(session_id):
+            try:
+                if session_id not in self.version_history:
+                    raise ValueError(f"Nenhum histórico encontrado para sessão {session_id}")
+                
+                # Encontrar checkpoint pelo índice
+                if checkpoint_id not in self._checkpoint_index.get(session_id, {}):
+                    raise ValueError(f"Checkpoint {checkpoint_id} não encontrado")
+                
+                # Reconstruir estado completo a partir da cadeia de deltas em disco
+                checkpoint = await self._load_checkpoint(session_id, checkpoint_id)
+                
+                # Criar checkpoint atual antes do rollback
+                current_checkpoint = await self._create_version_checkpoint(
+                    session_id, f"Backup antes do rollback para {checkpoint_id}"
+                )
+                
+                # Restaurar estado do PIG
+                await self._restore_pig_from_checkpoint(session_id, checkpoint)
+                
+                logger.info(f"Rollback realizado para checkpoint {checkpoint_id}")
+                
+                return {
+                    "success": True,
+                    "rolled_back_to": checkpoint_id,
+                    "backup_checkpoint": current_checkpoint,
+                    "restored_parameters": checkpoint.get('parameters', {}),
+                    "restored_operations": len(checkpoint.get('operations', []))
+                }
+                
+            except Exception as e:
+                logger.error(f"Erro no rollback: {e}")
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "checkpoint_id": checkpoint_id
+                }
     
     async def get_version_history(self, session_id: str) -> List[Dict[str, Any]]:
         """
         Version Control: Retorna histórico de versões
         """
-        return self.version_history.get(session_id, [])
+        return self._format_history(self.version_history.get(session_id, ()))
+    
+    async def get_version_history_summary(self, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Version Control: Retorna apenas os metadados dos checkpoints da sessão
+        """
+        return [
+            {
+                "checkpoint_id": entry['data'].get('checkpoint_id'),
+                "description": entry['data'].get('description'),
+                "timestamp": entry['data'].get('timestamp')
+            }
+            for entry in self.version_history.get(session_id, [])
+            if entry.get('type') == 'checkpoint'
+        ]
     
     async def enhanced_parameter_update(self, session_id: str, 
                                       parameter_updates: Dict[str, Any],
@@ -612,78 +849,83 @@ class PIGManager:
         Returns:
             Resultado da atualização incluindo nós afetados
         """
-        try:
-            pig = await self.get_graph(session_id)
-            all_affected_nodes = []
-            update_results = {}
-            
-            # Criar checkpoint antes da atualização
-            checkpoint_id = await self.create_version_checkpoint(
-                session_id, f"Antes da atualização de parâmetros: {list(parameter_updates.keys())}"
-            )
-            
-            # Atualizar cada parâmetro
-            for param_name, new_value in parameter_updates.items():
-                try:
-                    # Validar novo valor
-                    validation_result = await self._validate_parameter_value(
-                        session_id, param_name, new_value
-                    )
-                    
-                    if validation_result['is_valid']:
-                        # Atualizar parâmetro
-                        affected_nodes = await self.update_parameter_value(
-                            session_id, param_name, new_value
+        async with self._get_session_lock(session_id):
+            try:
+                pig = await self.get_graph(session_id)
+                all_affected_nodes = []
+                update_results = {}
+                
+                # Criar checkpoint antes da atualização
+                checkpoint_id = await self._create_version_checkpoint(
+                    session_id, f"Antes da atualização de parâmetros: {list(parameter_updates.keys())}"
+                )
+                
+                # Atualizar cada parâmetro
+                for param_name, new_value in parameter_updates.items():
+                    try:
+                        # Validar novo valor
+                        validation_result = self._check_parameter_value(
+                            pig, param_name, new_value
                         )
-                        all_affected_nodes.extend(affected_nodes)
                         
-                        update_results[param_name] = {
-                            "success": True,
-                            "new_value": new_value,
-                            "affected_nodes": affected_nodes
-                        }
-                    else:
+                        if validation_result['is_valid']:
+                            # Atualizar parâmetro
+                            affected_nodes = await self.update_parameter_value(
+                                session_id, param_name, new_value
+                            )
+                            all_affected_nodes.extend(affected_nodes)
+                            
+                            update_results[param_name] = {
+                                "success": True,
+                                "new_value": new_value,
+                                "affected_nodes": affected_nodes
+                            }
+                        else:
+                            update_results[param_name] = {
+                                "success": False,
+                                "error": validation_result['error'],
+                                "validation_details": validation_result
+                            }
+                            
+                    except Exception as e:
                         update_results[param_name] = {
                             "success": False,
-                            "error": validation_result['error'],
-                            "validation_details": validation_result
+                            "error": str(e)
                         }
-                        
-                except Exception as e:
-                    update_results[param_name] = {
-                        "success": False,
-                        "error": str(e)
-                    }
-            
-            # Remover duplicatas dos nós afetados
-            all_affected_nodes = list(set(all_affected_nodes))
-            
-            # Adicionar ao histórico
-            await self._add_version_to_history(session_id, "parameter_update", {
-                "parameter_updates": parameter_updates,
-                "update_results": update_results,
-                "affected_nodes": all_affected_nodes,
-                "checkpoint_before": checkpoint_id
-            })
-            
-            logger.info(f"Parâmetros atualizados: {len(parameter_updates)} parâmetros, {len(all_affected_nodes)} nós afetados")
-            
-            return {
-                "success": True,
-                "updated_parameters": list(parameter_updates.keys()),
-                "update_results": update_results,
-                "affected_nodes": all_affected_nodes,
-                "checkpoint_before": checkpoint_id,
-                "total_affected": len(all_affected_nodes)
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro na atualização aprimorada de parâmetros: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "parameter_updates": parameter_updates
-            } 
+                
+                # Remover duplicatas dos nós afetados
+                all_affected_nodes = list(set(all_affected_nodes))
+                
+                # Adicionar ao histórico
+                await self._add_version_to_history(session_id, "parameter_update", {
+                    "parameter_updates": parameter_updates,
+                    "update_results": update_results,
+                    "affected_nodes": all_affected_nodes,
+                    "checkpoint_before": checkpoint_id
+                })
+                
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(
+                        "Parâmetros atualizados: %d parâmetros, %d nós afetados",
+                        len(parameter_updates), len(all_affected_nodes)
+                    )
+                
+                return {
+                    "success": True,
+                    "updated_parameters": list(parameter_updates.keys()),
+                    "update_results": update_results,
+                    "affected_nodes": all_affected_nodes,
+                    "checkpoint_before": checkpoint_id,
+                    "total_affected": len(all_affected_nodes)
+                }
+                
+            except Exception as e:
+                logger.error(f"Erro na atualização aprimorada de parâmetros: {e}")
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "parameter_updates": parameter_updates
+                } 
 
     # HELPER METHODS FOR EDIT FUNCTIONALITY
     
@@ -733,73 +975,140 @@ class PIGManager:
             logger.error(f"Erro ao extrair metadados: {e}")
             return {}
     
-    async def _extract_parameters_from_code(self, code: str) -> Dict[str, Any]:
-        """Extrai parâmetros do código Python gerado"""
+    def _parse_generated_code(self, code: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """
+        Extrai parâmetros e operações CadQuery do código gerado com um único ast.parse.
+        Retorna None se o código não for Python válido.
+        """
         try:
-            parameters = {}
-            
-            # Procurar linhas de atribuição de parâmetros
-            param_pattern = r'^\s*(\w+)\s*=\s*(.+?)(?:\s*#.*)?$'
-            
-            in_parameters_section = False
-            for line in code.split('\n'):
-                line = line.strip()
-                
-                # Detectar início da seção de parâmetros
-                if '# Parâmetros' in line or 'Parameters' in line:
-                    in_parameters_section = True
-                    continue
-                
-                # Detectar fim da seção de parâmetros
-                if in_parameters_section and ('# Operações' in line or 'Operations' in line):
-                    break
-                
-                # Extrair parâmetros
-                if in_parameters_section and line and not line.startswith('#'):
-                    match = re.match(param_pattern, line)
-                    if match:
-                        param_name = match.group(1)
-                        param_value_str = match.group(2)
-                        
-                        # Tentar converter o valor
-                        try:
-                            param_value = eval(param_value_str)
-                            parameters[param_name] = param_value
-                        except:
-                            parameters[param_name] = param_value_str
-            
-            return parameters
-            
-        except Exception as e:
-            logger.error(f"Erro ao extrair parâmetros do código: {e}")
-            return {}
+            tree = ast.parse(code)
+        except SyntaxError:
+            return None
+        
+        # O template do executor envolve parâmetros e operações em um bloco try
+        body = tree.body
+        for stmt in tree.body:
+            if isinstance(stmt, ast.Try):
+                body = stmt.body
+                break
+        
+        # Linha do marcador da seção de operações (se existir)
+        marker_index = code.find('# Operações')
+        operations_line = code.count('\n', 0, marker_index) + 1 if marker_index != -1 else None
+        
+        parameters = {}
+        operation_stmts = []
+        for stmt in body:
+            # Fim da seção de operações: bloco que extrai informações do resultado
+            if (isinstance(stmt, ast.If) and isinstance(stmt.test, ast.Compare)
+                    and isinstance(stmt.test.left, ast.Constant) and stmt.test.left.value == 'result'):
+                break
+            
+            if operations_line is not None:
+                is_parameter = stmt.lineno < operations_line
+            else:
+                # Sem marcador: parâmetros são as atribuições simples iniciais
+                is_parameter = not operation_stmts and self._is_parameter_assignment(stmt)
+            
+            if is_parameter:
+                if self._is_parameter_assignment(stmt):
+                    try:
+                        parameters[stmt.targets[0].id] = ast.literal_eval(stmt.value)
+                    except _LITERAL_EVAL_ERRORS:
+                        parameters[stmt.targets[0].id] = ast.get_source_segment(code, stmt.value)
+            else:
+                operation_stmts.append(stmt)
+        
+        if not operation_stmts:
+            return parameters, ""
+        
+        # Com marcador, a seção começa logo após ele (mantendo comentários antes da primeira operação)
+        first_line = operation_stmts[0].lineno - 1
+        if operations_line is not None:
+            first_line = min(first_line, operations_line)
+        lines = itertools.islice(io.StringIO(code), first_line, operation_stmts[-1].end_lineno)
+        cadquery_code = '\n'.join(line.rstrip('\r\n') for line in lines if line.strip())
+        
+        return parameters, cadquery_code
     
-    async def _extract_cadquery_operations(self, code: str) -> str:
-        """Extrai operações CadQuery do código Python"""
-        try:
-            lines = code.split('\n')
-            cadquery_lines = []
-            
-            in_operations_section = False
-            for line in lines:
-                # Detectar início da seção de operações
-                if '# Operações' in line or 'Operations' in line:
-                    in_operations_section = True
-                    continue
-                
-                # Detectar fim da seção de operações
-                if in_operations_section and ('# Extrair informações' in line or 'if \'result\' in locals():' in line):
-                    break
-                
-                # Coletar linhas de operações
-                if in_operations_section and line.strip():
-                    cadquery_lines.append(line)
-            
-            return '\n'.join(cadquery_lines)
-            
-        except Exception as e:
-            logger.error(f"Erro ao extrair operações CadQuery: {e}")
+    @staticmethod
+    def _is_parameter_assignment(stmt: ast.stmt) -> bool:
+        """Verifica se o statement é uma atribuição simples de parâmetro (sem chamadas)"""
+        return (
+            isinstance(stmt, ast.Assign)
+            and len(stmt.targets) == 1
+            and isinstance(stmt.targets[0], ast.Name)
+            and not any(isinstance(node, ast.Call) for node in ast.walk(stmt.value))
+        )
+    
+    def _parse_code_sections(self, code: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Extrai parâmetros e operações CadQuery sem ast (código com erro de sintaxe).
+        Os limites da seção de operações são localizados com str.find; apenas as
+        linhas anteriores a ela são percorridas em busca de parâmetros.
+        """
+        parameters = {}
+        section = _CodeSection.NONE
+        
+        # Início da seção de operações (encerra a de parâmetros)
+        ops_marker = _find_first(code, _OPERATIONS_MARKERS)
+        params_source = code if ops_marker == -1 else code[:ops_marker]
+        
+        for line in io.StringIO(params_source):
+            stripped = line.strip()
+            
+            # Detectar início da seção de parâmetros
+            if '# Parâmetros' in stripped or 'Parameters' in stripped:
+                section = _CodeSection.PARAMS
+                continue
+            
+            # Extrair parâmetros
+            if section is _CodeSection.PARAMS and stripped and not stripped.startswith('#'):
+                match = _PARAM_RE.match(stripped)
+                if match:
+                    param_name = match.group(1)
+                    param_value_str = match.group(2)
+                    
+                    # Tentar converter o valor
+                    try:
+                        parameters[param_name] = self._parse_literal(param_value_str)
+                    except _LITERAL_EVAL_ERRORS:
+                        parameters[param_name] = param_value_str
+        
+        return parameters, self._slice_operations_section(code, ops_marker)
+    
+    @staticmethod
+    def _slice_operations_section(code: str, ops_marker: int) -> str:
+        """Recorta as linhas não vazias entre o marcador de operações e o fim da seção"""
+        if ops_marker == -1:
+            return ""
+        
+        newline = code.find('\n', ops_marker)
+        if newline == -1:
             return ""
+        start = newline + 1
+        
+        # Fim da seção: início da linha que contém o marcador final
+        end = _find_first(code, _OPERATIONS_END_MARKERS, start)
+        if end != -1:
+            end = code.rfind('\n', start, end) + 1 or start
+        block = code[start:end] if end != -1 else code[start:]
+        
+        return '\n'.join(
+            line for line in block.split('\n')
+            if line.strip() and not any(marker in line for marker in _OPERATIONS_MARKERS)
+        )
+    
+    @staticmethod
+    def _parse_literal(value_str: str) -> Any:
+        """Converte literal Python de forma segura (caminho rápido para int/float/bool)"""
+        if _INT_LITERAL_RE.fullmatch(value_str):
+            return int(value_str)
+        if _FLOAT_LITERAL_RE.fullmatch(value_str):
+            return float(value_str)
+        if value_str in _BOOL_LITERALS:
+            return _BOOL_LITERALS[value_str]
+        return ast.literal_eval(value_str)
     
     async def _update_pig_from_loaded_data(self, session_id: str, 
                                          parameters: Dict[str, Any], 
@@ -810,13 +1119,11 @@ class PIGManager:
             pig = await self.get_graph(session_id)
             
             # Limpar PIG atual
-            pig.nodes.clear()
-            pig.execution_order.clear()
-            pig.root_nodes.clear()
+            pig.clear()
             
             # Adicionar parâmetros
             for param_name, param_value in parameters.items():
-                await self._add_parameter_to_pig(pig, param_name, param_value)
+                self._add_parameter_to_pig(pig, param_name, param_value)
             
             # Criar operação principal com o código CadQuery
             if cadquery_code.strip():
@@ -836,25 +1143,50 @@ class PIGManager:
             logger.error(f"Erro ao atualizar PIG com dados carregados: {e}")
             raise
     
-    async def _validate_cadquery_code(self, code: str) -> Dict[str, Any]:
-        """Valida código CadQuery"""
+    def _get_code_analysis(self, code: str) -> Dict[str, Any]:
+        """Retorna a entrada de cache de análise do código (LRU por hash do conteúdo)"""
+        key = hashlib.blake2b(code.encode('utf-8'), digest_size=16).hexdigest()
+        entry = self._code_analysis_cache.get(key)
+        if entry is None:
+            entry = self._code_analysis_cache[key] = {}
+            if len(self._code_analysis_cache) > CODE_ANALYSIS_CACHE_SIZE:
+                self._code_analysis_cache.popitem(last=False)
+        else:
+            self._code_analysis_cache.move_to_end(key)
+        return entry
+    
+    def _validate_cadquery_code(self, code: str) -> Dict[str, Any]:
+        """Valida código CadQuery (resultado em cache por hash do código)"""
+        analysis = self._get_code_analysis(code)
+        if 'validation' not in analysis:
+            analysis['validation'] = self._check_cadquery_code(code)
+        return analysis['validation']
+    
+    def _check_cadquery_code(self, code: str) -> Dict[str, Any]:
+        """Executa as validações do código CadQuery"""
         try:
             # Validações básicas
             if not code.strip():
                 return {"is_valid": False, "error": "Código vazio"}
             
+            # Localizar todos os marcadores em uma única passada (para quando todos aparecem)
+            found = set()
+            for match in _VALIDATION_MARKERS_RE.finditer(code):
+                found.add(match.group(0))
+                if len(found) == len(_ALL_VALIDATION_MARKERS):
+                    break
+            
             # Verificar imports necessários
-            if 'cq.' in code and 'import cadquery as cq' not in code:
+            if 'cq.' in found and 'import cadquery as cq' not in found:
                 return {"is_valid": False, "error": "Import 'cadquery as cq' necessário"}
             
             # Verificar sintaxe Python básica
-            try:
-                compile(code, '<string>', 'exec')
-            except SyntaxError as e:
-                return {"is_valid": False, "error": f"Erro de sintaxe: {str(e)}"}
+            syntax_error = self._syntax_check(code)
+            if syntax_error is not None:
+                return {"is_valid": False, "error": f"Erro de sintaxe: {syntax_error}"}
             
             # Verificar se usa variável 'result'
-            if 'result' not in code:
+            if 'result' not in found:
                 return {"is_valid": False, "error": "Código deve definir variável 'result'"}
             
             return {"is_valid": True, "warnings": []}
@@ -862,64 +1194,55 @@ class PIGManager:
         except Exception as e:
             return {"is_valid": False, "error": f"Erro na validação: {str(e)}"}
     
-    async def _detect_parameters_in_code(self, code: str) -> Dict[str, Dict[str, Any]]:
-        """Detecta parâmetros utilizados no código CadQuery"""
-        try:
-            parameters = {}
-            
-            # Procurar por variáveis que parecem parâmetros
-            var_pattern = r'\b([a-zA-Z_][a-zA-Z0-9_]*)\b'
-            
-            # Palavras-chave do CadQuery e Python que não são parâmetros
-            excluded_words = {
-                'cq', 'result', 'Workplane', 'box', 'cylinder', 'sphere', 'extrude', 
-                'cut', 'union', 'fillet', 'chamfer', 'faces', 'edges', 'vertices',
-                'XY', 'XZ', 'YZ', 'import', 'as', 'from', 'def', 'class', 'if', 
-                'else', 'elif', 'for', 'while', 'try', 'except', 'finally',
-                'and', 'or', 'not', 'in', 'is', 'True', 'False', 'None'
+    def _syntax_check(self, code: str) -> Optional[str]:
+        """
+        Compila o código uma única vez por hash, guardando o resultado no cache de análise.
+        Retorna None se a sintaxe for válida ou a mensagem do SyntaxError.
+        """
+        analysis = self._get_code_analysis(code)
+        if 'syntax_error' not in analysis:
+            try:
+                compile(code, '<string>', 'exec')
+                analysis['syntax_error'] = None
+            except SyntaxError as e:
+                analysis['syntax_error'] = str(e)
+        return analysis['syntax_error']
+    
+    def _detect_parameters_in_code(self, code: str) -> Dict[str, Dict[str, Any]]:
+        """Detecta parâmetros utilizados no código CadQuery (resultado em cache por hash do código)"""
+        analysis = self._get_code_analysis(code)
+        if 'parameters' not in analysis:
+            analysis['parameters'] = self._scan_code_parameters(code)
+        return analysis['parameters']
+    
+    def _scan_code_parameters(self, code: str) -> Dict[str, Dict[str, Any]]:
+        """Varre o código em busca de variáveis que parecem parâmetros"""
+        parameters = {}
+        
+        # Procurar por variáveis que parecem parâmetros (palavras reservadas removidas em C)
+        variables = set(_VAR_RE.findall(code)) - _EXCLUDED_WORDS
+        candidates = {
+            var for var in variables
+            if len(var) > 1 and var[0] != '_' and not var.isupper()  # isupper: constantes
+        }
+        
+        for var in candidates:
+            # Tentar inferir tipo baseado no nome
+            param_type = self._infer_parameter_type(var)
+            default_value = param_type.get('default_value', 10.0)
+            
+            parameters[var] = {
+                'type': param_type.get('type', ParameterType.NUMERIC),
+                'default_value': default_value,
+                'inferred_from': 'code_analysis'
             }
-            
-            variables = set(re.findall(var_pattern, code))
-            
-            for var in variables:
-                if (var not in excluded_words and 
-                    not var.startswith('_') and
-                    not var.isupper() and  # Constantes
-                    len(var) > 1):
-                    
-                    # Tentar inferir tipo baseado no contexto
-                    param_type = self._infer_parameter_type(var, code)
-                    default_value = param_type.get('default_value', 10.0)
-                    
-                    parameters[var] = {
-                        'type': param_type.get('type', ParameterType.NUMERIC),
-                        'default_value': default_value,
-                        'inferred_from': 'code_analysis'
-                    }
-            
-            return parameters
-            
-        except Exception as e:
-            logger.error(f"Erro ao detectar parâmetros: {e}")
-            return {}
+        
+        return parameters
     
-    def _infer_parameter_type(self, var_name: str, code: str) -> Dict[str, Any]:
-        """Infere tipo de parâmetro baseado no nome e contexto"""
-        var_name_lower = var_name.lower()
-        
-        # Inferir tipo baseado no nome
-        if any(keyword in var_name_lower for keyword in ['width', 'height', 'depth', 'length', 'size', 'radius', 'diameter']):
-            return {'type': ParameterType.NUMERIC, 'default_value': 10.0}
-        elif any(keyword in var_name_lower for keyword in ['count', 'number', 'num']):
-            return {'type': ParameterType.NUMERIC, 'default_value': 4}
-        elif any(keyword in var_name_lower for keyword in ['angle', 'rotation']):
-            return {'type': ParameterType.NUMERIC, 'default_value': 90.0}
-        elif any(keyword in var_name_lower for keyword in ['enable', 'show', 'visible']):
-            return {'type': ParameterType.BOOLEAN, 'default_value': True}
-        elif any(keyword in var_name_lower for keyword in ['name', 'label', 'text']):
-            return {'type': ParameterType.STRING, 'default_value': "Parameter"}
-        else:
-            return {'type': ParameterType.NUMERIC, 'default_value': 10.0}
+    def _infer_parameter_type(self, var_name: str) -> Dict[str, Any]:
+        """Infere tipo de parâmetro baseado no nome"""
+        param_type, default_value = _infer_type_from_name(var_name.lower())
+        return {'type': param_type, 'default_value': default_value}
     
     async def _recalculate_dependencies(self, session_id: str, operation_id: str) -> List[str]:
         """Recalcula dependências após edição de código"""
@@ -929,20 +1252,21 @@ class PIGManager:
             if operation_id not in pig.nodes:
                 return []
             
-            node = pig.nodes[operation_id]
-            
-            # Obter todos os nós que dependem desta operação
+            # Obter todos os nós que dependem desta operação (BFS iterativa)
+            nodes = pig.nodes
             affected_nodes = [operation_id]
+            visited = {operation_id}
+            queue = deque([operation_id])
             
-            def collect_dependents(node_id):
-                current_node = pig.nodes.get(node_id)
-                if current_node:
-                    for dependent_id in current_node.dependents:
-                        if dependent_id not in affected_nodes:
-                            affected_nodes.append(dependent_id)
-                            collect_dependents(dependent_id)
-            
-            collect_dependents(operation_id)
+            while queue:
+                current_node = nodes.get(queue.popleft())
+                if not current_node:
+                    continue
+                for dependent_id in current_node.dependents:
+                    if dependent_id not in visited:
+                        visited.add(dependent_id)
+                        affected_nodes.append(dependent_id)
+                        queue.append(dependent_id)
             
             # Recalcular ordem de execução
             pig.get_execution_order()
@@ -959,6 +1283,17 @@ class PIGManager:
         """Valida novo valor de parâmetro"""
         try:
             pig = await self.get_graph(session_id)
+            return self._check_parameter_value(pig, param_name, new_value)
+            
+        except Exception as e:
+            logger.error(f"Erro na validação do parâmetro: {e}")
+            return {"is_valid": False, "error": str(e)}
+    
+    def _check_parameter_value(self, pig: ParametricIntentionGraph, 
+                               param_name: str, 
+                               new_value: Any) -> Dict[str, Any]:
+        """Executa as validações do novo valor de parâmetro sobre o PIG já obtido"""
+        try:
             param_id = pig.find_parameter_by_name(param_name)
             
             if not param_id:
@@ -966,32 +1301,11 @@ class PIGManager:
             
             param_node = pig.nodes[param_id]
             
-            # Validar tipo
-            if hasattr(param_node, 'parameter_type'):
-                param_type = param_node.parameter_type
-                
-                if param_type == ParameterType.NUMERIC:
-                    if not isinstance(new_value, (int, float)):
-                        return {"is_valid": False, "error": "Valor deve ser numérico"}
-                    
-                    # Verificar limites se definidos
-                    if hasattr(param_node, 'min_value') and param_node.min_value is not None:
-                        if new_value < param_node.min_value:
-                            return {"is_valid": False, "error": f"Valor deve ser >= {param_node.min_value}"}
-                    
-                    if hasattr(param_node, 'max_value') and param_node.max_value is not None:
-                        if new_value > param_node.max_value:
-                            return {"is_valid": False, "error": f"Valor deve ser <= {param_node.max_value}"}
-                
-                elif param_type == ParameterType.BOOLEAN:
-                    if not isinstance(new_value, bool):
-                        return {"is_valid": False, "error": "Valor deve ser booleano"}
-                
-                elif param_type == ParameterType.STRING:
-                    if not isinstance(new_value, str):
-                        return {"is_valid": False, "error": "Valor deve ser string"}
-            
-            return {"is_valid": True}
+            # Validar tipo (tipos sem validador, como vetores, são aceitos)
+            validator = _VALUE_VALIDATORS.get(getattr(param_node, 'parameter_type', None))
+            if validator is None:
+                return {"is_valid": True}
+            return validator(param_node, new_value)
             
         except Exception as e:
             logger.error(f"Erro na validação do parâmetro: {e}")
@@ -1000,22 +1314,146 @@ class PIGManager:
     async def _add_version_to_history(self, session_id: str, action_type: str, data: Dict[str, Any]):
         """Adiciona entrada ao histórico de versões"""
         try:
-            if session_id not in self.version_history:
-                self.version_history[session_id] = []
-            
-            self.version_history[session_id].append({
+            await self._append_history_entry(session_id, {
                 "type": action_type,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": time.time(),
                 "data": data
             })
-            
-            # Manter apenas os últimos 100 registros
-            if len(self.version_history[session_id]) > 100:
-                self.version_history[session_id] = self.version_history[session_id][-100:]
                 
         except Exception as e:
             logger.error(f"Erro ao adicionar ao histórico: {e}")
     
+    @staticmethod
+    def _format_history(entries) -> List[Dict[str, Any]]:
+        """Converte os timestamps numéricos do histórico para ISO apenas na leitura"""
+        formatted = []
+        for entry in entries:
+            timestamp = entry.get('timestamp')
+            if isinstance(timestamp, float):
+                entry = {**entry, "timestamp": datetime.fromtimestamp(timestamp).isoformat()}
+            formatted.append(entry)
+        return formatted
+    
+    async def _append_history_entry(self, session_id: str, entry: Dict[str, Any]):
+        """Adiciona registro ao histórico limitado, mantendo o índice de checkpoints coerente"""
+        history = self.version_history[session_id]
+        
+        # O deque descarta o registro mais antigo; remover do índice se for checkpoint
+        evicted_checkpoint = False
+        if len(history) == history.maxlen:
+            oldest = history[0]
+            if oldest.get('type') == 'checkpoint':
+                self._checkpoint_index.get(session_id, {}).pop(oldest['data'].get('checkpoint_id'), None)
+                evicted_checkpoint = True
+        
+        history.append(entry)
+        
+        if evicted_checkpoint:
+            await self._delete_orphan_checkpoints(session_id)
+    
+    async def _delete_orphan_checkpoints(self, session_id: str):
+        """Remove do disco checkpoints fora do histórico que não são base de nenhum checkpoint mantido"""
+        files = self._checkpoint_files.get(session_id)
+        if not files:
+            return
+        
+        # Checkpoints mantidos e toda a cadeia de bases de que dependem
+        live = set()
+        pending = [*self._checkpoint_index.get(session_id, {}), self._last_checkpoint.get(session_id)]
+        while pending:
+            checkpoint_id = pending.pop()
+            if checkpoint_id in live or checkpoint_id not in files:
+                continue
+            live.add(checkpoint_id)
+            pending.append(files[checkpoint_id])
+        
+        orphans = [checkpoint_id for checkpoint_id in files if checkpoint_id not in live]
+        if not orphans:
+            return
+        for checkpoint_id in orphans:
+            del files[checkpoint_id]
+        await asyncio.to_thread(
+            self._delete_checkpoint_files,
+            [self._get_checkpoint_path(session_id, checkpoint_id) for checkpoint_id in orphans]
+        )
+        logger.debug("Removidos %d checkpoints órfãos da sessão %s", len(orphans), session_id)
+    
+    def _get_checkpoint_path(self, session_id: str, checkpoint_id: str) -> Path:
+        """
+        Caminho do arquivo de payload de um checkpoint. O session_id vem do cliente:
+        o diretório usa seu hash, para que nunca saia de checkpoint_dir.
+        """
+        session_dir = hashlib.blake2b(session_id.encode('utf-8'), digest_size=16).hexdigest()
+        return self.checkpoint_dir / session_dir / f"{checkpoint_id}.json"
+    
+    @staticmethod
+    def _delete_checkpoint_files(paths: List[Path]):
+        """Remove arquivos de checkpoint do disco (executado em thread)"""
+        for path in paths:
+            path.unlink(missing_ok=True)
+    
+    @staticmethod
+    def _write_checkpoint_file(path: Path, content: str):
+        """Grava payload de checkpoint em disco (executado em thread)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding='utf-8')
+    
+    async def _load_checkpoint(self, session_id: str, checkpoint_id: str) -> Dict[str, Any]:
+        """Reconstrói o estado completo de um checkpoint aplicando a cadeia de deltas"""
+        chain = []
+        current_id = checkpoint_id
+        while current_id:
+            if any(payload['checkpoint_id'] == current_id for payload in chain):
+                raise ValueError(f"Cadeia de checkpoints inválida em {current_id}")
+            path = self._get_checkpoint_path(session_id, current_id)
+            if not path.exists():
+                raise FileNotFoundError(f"Arquivo do checkpoint {current_id} não encontrado")
+            payload = json.loads(await asyncio.to_thread(path.read_text, encoding='utf-8'))
+            chain.append(payload)
+            current_id = payload.get('base_checkpoint')
+        
+        # Aplicar deltas do snapshot completo até o checkpoint solicitado
+        nodes: Dict[str, Dict[str, Any]] = {}
+        for payload in reversed(chain):
+            for node_id in payload.get('removed_nodes', []):
+                nodes.pop(node_id, None)
+            nodes.update(payload.get('nodes', {}))
+        
+        target = chain[0]
+        execution_order = [node_id for node_id in target.get('execution_order', []) if node_id in nodes]
+        
+        parameters = {}
+        for node_id, data in nodes.items():
+            if data.get('node_type') == NodeType.PARAMETER.value:
+                parameters[data['name']] = {
+                    "id": node_id,
+                    "value": data.get('value'),
+                    "type": data.get('parameter_type', 'unknown'),
+                    "units": data.get('units'),
+                    "description": data.get('description')
+                }
+        
+        operations = []
+        for node_id in execution_order:
+            data = nodes[node_id]
+            if data.get('node_type') == NodeType.OPERATION.value:
+                operations.append({
+                    "id": node_id,
+                    "name": data.get('name'),
+                    "type": data.get('operation_type', 'unknown'),
+                    "description": data.get('description'),
+                    "inputs": data.get('inputs', {}),
+                    "code": data.get('cadquery_code', '')
+                })
+        
+        return {
+            "checkpoint_id": target['checkpoint_id'],
+            "description": target.get('description'),
+            "timestamp": target.get('timestamp'),
+            "parameters": parameters,
+            "operations": operations
+        }
+    
     async def _restore_pig_from_checkpoint(self, session_id: str, checkpoint_data: Dict[str, Any]):
         """Restaura PIG de um checkpoint"""
         try:
@@ -1025,6 +1463,7 @@ class PIGManager:
             
             # Restaurar parâmetros
             parameters = checkpoint_data.get('parameters', {})
+            parameter_nodes = []
             for param_name, param_info in parameters.items():
                 param_value = param_info.get('value')
                 param_type_str = param_info.get('type', 'numeric')
@@ -1038,22 +1477,40 @@ class PIGManager:
                 elif param_type_str == 'vector':
                     param_type = ParameterType.VECTOR
                 
-                await self.add_parameter(
-                    session_id, param_name, param_value, param_type,
-                    param_info.get('description')
-                )
+                # Dados do próprio checkpoint (já validados ao serem gravados): model_construct
+                # pula a validação do pydantic; ids originais preservam as ligações dos inputs
+                parameter_nodes.append(ParameterNode.model_construct(
+                    id=param_info.get('id') or new_id(),
+                    name=param_name,
+                    value=param_value,
+                    parameter_type=param_type,
+                    description=param_info.get('description')
+                ))
             
             # Restaurar operações
             operations = checkpoint_data.get('operations', [])
-            for op in operations:
-                await self.add_operation(
-                    session_id,
-                    op.get('name', 'restored_operation'),
-                    op.get('type', 'unknown'),
-                    op.get('code', ''),
-                    op.get('inputs', {}),
-                    op.get('description')
+            operation_nodes = [
+                OperationNode.model_construct(
+                    id=op.get('id') or new_id(),
+                    name=op.get('name', 'restored_operation'),
+                    value=None,
+                    operation_type=op.get('type', 'unknown'),
+                    cadquery_code=op.get('code', ''),
+                    inputs=op.get('inputs') or {},
+                    description=op.get('description')
                 )
+                for op in operations
+            ]
+            
+            # Inserir tudo em lote e recalcular a ordem de execução uma única vez
+            pig.bulk_add(parameter_nodes, operation_nodes)
+            pig.get_execution_order()
+            
+            # Os nós restaurados mantêm os ids, mas recomeçam com revisão 0: descartar a base
+            # de deltas para que o próximo checkpoint seja um snapshot completo
+            self._checkpoint_node_revs.pop(session_id, None)
+            self._last_checkpoint.pop(session_id, None)
+            self._checkpoint_chain_length.pop(session_id, None)
             
             logger.info(f"PIG restaurado de checkpoint com {len(parameters)} parâmetros e {len(operations)} operações")
             
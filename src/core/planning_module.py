@@ -1,15 +1,28 @@
 import os
+import sys
+import atexit
 import json
+import hashlib
 import logging
-from typing import Dict, Any, List, Optional
-from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
 from pathlib import Path
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
-import textwrap
 import re
 import requests
 import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele usa-se o json da biblioteca padrão
+    orjson = None
 
 from ..models import (
     LLMQuery, LLMResponse, ExecutionPlan, ASTNode, 
@@ -19,158 +32,467 @@ from ..models import (
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+def _default_serializer(o):
+    """Fallback de serialização para tipos não suportados nativamente"""
+    if isinstance(o, datetime):
+        return o.isoformat()
+    # Sets (ex.: dependências de nós do PIG) não são suportados nativamente pelo orjson nem pelo json
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    # Para objetos Pydantic, usar .model_dump() ao invés de serialização direta
+    if hasattr(o, 'model_dump'):
+        return o.model_dump()
+    raise TypeError(f"Object of type {type(o)} is not JSON serializable")
+
 def safe_json_dumps(obj, **kwargs):
-    """Serialização JSON segura que lida com objetos datetime"""
-    def default_serializer(o):
-        if isinstance(o, datetime):
-            return o.isoformat()
-        # Para objetos Pydantic, usar .model_dump() ao invés de serialização direta
-        if hasattr(o, 'model_dump'):
-            return o.model_dump()
-        raise TypeError(f"Object of type {type(o)} is not JSON serializable")
+    """Serialização JSON segura que lida com objetos datetime e Pydantic"""
+    # orjson só oferece indentação de 2 espaços; demais opções caem no json padrão
+    indent = kwargs.get('indent')
+    if orjson is not None and set(kwargs) <= {'indent', 'sort_keys'} and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys'):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default_serializer, option=option).decode('utf-8')
     
-    return json.dumps(obj, default=default_serializer, **kwargs)
+    return json.dumps(obj, default=_default_serializer, **kwargs)
 
-class PlanningModule:
+# Cache de contexto do Gemini para a parte fixa do prompt (documentação + schema)
+GEMINI_CONTEXT_CACHE_TTL = timedelta(hours=1)
+GEMINI_CONTEXT_CACHE_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Gravação das interações com o LLM em segundo plano
+LLM_SAVE_QUEUE_SIZE = 1024
+LLM_SAVE_BATCH_SIZE = 32
+LLM_SAVE_BATCH_WAIT = 0.1  # segundos aguardando mais itens para o mesmo lote
+LLM_LOG_BUFFER_SIZE = 1 << 16  # buffer do arquivo JSONL de interações da sessão
+
+# Lista de modelos disponíveis por servidor Ollama: base_url -> (instante monotônico, nomes)
+OLLAMA_TAGS_CACHE_TTL = 60.0  # segundos
+_OLLAMA_TAGS_CACHE: Dict[str, Tuple[float, List[str]]] = {}
+_ollama_http = None
+
+# Tempo que o Ollama mantém o modelo carregado após cada chamada (-1 = sempre residente)
+_keep_alive_env = os.getenv("OLLAMA_KEEP_ALIVE", "-1")
+OLLAMA_KEEP_ALIVE = int(_keep_alive_env) if _keep_alive_env.lstrip('-').isdigit() else _keep_alive_env
+
+# Log de progresso do streaming: relógio consultado a cada N chunks, log no máximo a cada X segundos
+OLLAMA_PROGRESS_CHECK_EVERY = 64
+OLLAMA_PROGRESS_LOG_INTERVAL = 5.0
+
+# Tamanho máximo de leitura do stream; com transfer-encoding chunked cada leitura
+# retorna assim que um chunk HTTP chega, então um buffer maior não atrasa tokens
+OLLAMA_STREAM_CHUNK_SIZE = 1 << 16
+
+def _ollama_session():
+    """Sessão HTTP compartilhada com o Ollama (reaproveita conexões entre chamadas)"""
+    global _ollama_http
+    if _ollama_http is None:
+        _ollama_http = requests.Session()
+    return _ollama_http
+
+# Limite de tokens gerados por resposta (o tempo de decodificação cresce linearmente com a saída)
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "8192"))
+
+# Máximo de chamadas simultâneas ao LLM por instância do planejador
+LLM_MAX_CONCURRENT_REQUESTS = 8
+
+# Quantidade de prompts montados mantidos em cache (LRU por hash das entradas)
+PROMPT_CACHE_SIZE = 64
+
+# Planos completos (já validados) reaproveitados para pedidos equivalentes após normalização do texto
+PLAN_CACHE_SIZE = 512
+
+def _normalize_request(text: str) -> str:
     """
-    Módulo de Planejamento - Interface com LLMs (Gemini e Ollama) para gerar planos de ação.
-    Converte linguagem natural em árvores de execução abstratas (AST).
+    Forma canônica de um pedido: minúsculas e espaços colapsados.
+    A pontuação é mantida: sinais e operadores ("-10", "1/2") mudam o significado do pedido.
     """
+    return ' '.join(text.casefold().split())
+
+# Planejador determinístico para criação de primitivas simples com dimensões explícitas
+# ("crie um cilindro com raio 10 e altura 20", "make a box 10x20x5"), sem chamar o LLM
+_RE_PRIMITIVE_REQUEST = re.compile(
+    r'^\s*(?:crie|criar|cria|fa[çc]a|fazer|gere|gerar|desenhe|modele|create|make|build|draw|generate)\s+'
+    r'(?:(?:um|uma|a|an)\s+)?(cilindro|cylinder|caixa|cubo|box|cube|esfera|sphere|cone)\b(.*)$',
+    re.IGNORECASE | re.DOTALL
+)
+_RE_PRIMITIVE_DIMENSION = re.compile(
+    r'(raio|radius|di[âa]metro|diameter|altura|height|largura|width|comprimento|length|'
+    r'profundidade|depth|lado|side)\s*(?:de|of|=|:)?\s*(\d+(?:[.,]\d+)?)\s*(?:mm)?',
+    re.IGNORECASE
+)
+_RE_PRIMITIVE_TRIPLET = re.compile(
+    r'(\d+(?:[.,]\d+)?)\s*x\s*(\d+(?:[.,]\d+)?)\s*x\s*(\d+(?:[.,]\d+)?)\s*(?:mm)?', re.IGNORECASE
+)
+# Conectivos permitidos entre as dimensões; qualquer outro texto delega o pedido ao LLM
+_RE_PRIMITIVE_FILLER = re.compile(r'^(?:\s|,|\.|!|\b(?:com|with|e|and|de|of)\b)*$', re.IGNORECASE)
+
+_PRIMITIVE_KINDS = {
+    'cilindro': 'cylinder', 'cylinder': 'cylinder',
+    'caixa': 'box', 'box': 'box', 'cubo': 'box', 'cube': 'box',
+    'esfera': 'sphere', 'sphere': 'sphere',
+    'cone': 'cone',
+}
+_DIMENSION_KEYS = {
+    'raio': 'radius', 'radius': 'radius',
+    'diâmetro': 'diameter', 'diametro': 'diameter', 'diameter': 'diameter',
+    'altura': 'height', 'height': 'height',
+    'largura': 'width', 'width': 'width',
+    'comprimento': 'length', 'length': 'length',
+    'profundidade': 'height', 'depth': 'height',
+    'lado': 'side', 'side': 'side',
+}
+
+def _try_deterministic_plan(user_request: str) -> Optional[LLMResponse]:
+    """
+    Monta diretamente o plano de primitivas simples (cilindro, caixa, esfera, cone) quando o pedido
+    traz apenas a primitiva e suas dimensões. Retorna None para qualquer outro pedido.
+    """
+    match = _RE_PRIMITIVE_REQUEST.match(user_request or '')
+    if not match:
+        return None
     
-    def __init__(self):
-        # Configuração do provider de LLM
-        self.llm_provider = os.getenv("LLM_PROVIDER", "gemini").lower()  # gemini ou ollama
-        self.ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        self.ollama_model = os.getenv("OLLAMA_MODEL", "")
-        self.ollama_timeout = int(os.getenv("OLLAMA_TIMEOUT", "600"))  # 10 minutos por padrão
-        
-        # Configuração Gemini (manter compatibilidade)
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        
-        # Inicializar o provider selecionado
-        if self.llm_provider == "ollama":
-            self._initialize_ollama()
-        else:
-            self._initialize_gemini()
-        
-        # Documentação da API CadQuery disponível para o LLM
-        self.cadquery_api_docs = self._load_cadquery_api_docs()
-        
-        # Diretório para salvar respostas do LLM
-        self.llm_responses_dir = Path("llm_responses")
-        self.llm_responses_dir.mkdir(exist_ok=True)
-        logger.info(f"Respostas do LLM serão salvas em: {self.llm_responses_dir.absolute()}")
-        
-    def _initialize_gemini(self):
-        """Inicializa configuração do Gemini"""
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY não encontrada nas variáveis de ambiente")
-        
-        genai.configure(api_key=self.api_key)
-        
-        self.generation_config = genai.types.GenerationConfig(
-            temperature=0.1,
-            response_mime_type="application/json",
-            max_output_tokens=15000
-        )
+    kind = _PRIMITIVE_KINDS[match.group(1).casefold()]
+    rest = match.group(2)
+    
+    dims: Dict[str, float] = {}
+    triplet = _RE_PRIMITIVE_TRIPLET.search(rest)
+    if triplet:
+        dims['length'], dims['width'], dims['height'] = (float(v.replace(',', '.')) for v in triplet.groups())
+        rest = rest[:triplet.start()] + rest[triplet.end():]
+    for name, value in _RE_PRIMITIVE_DIMENSION.findall(rest):
+        key = _DIMENSION_KEYS[name.casefold()]
+        if key in dims:
+            # Dimensão informada duas vezes (ex.: altura e profundidade): ambíguo, delegar ao LLM
+            return None
+        dims[key] = float(value.replace(',', '.'))
+    
+    if not _RE_PRIMITIVE_FILLER.match(_RE_PRIMITIVE_DIMENSION.sub('', rest)):
+        return None
+    
+    if 'diameter' in dims:
+        dims.setdefault('radius', dims['diameter'] / 2)
+    if 'side' in dims:
+        for axis in ('length', 'width', 'height'):
+            dims.setdefault(axis, dims['side'])
+    
+    if kind == 'cylinder' and {'radius', 'height'} <= dims.keys():
+        parameters = {"cylinder_height": dims['height'], "cylinder_radius": dims['radius']}
+        code = "result = cq.Workplane('XY').cylinder(cylinder_height, cylinder_radius)"
+        text = f"Criando um cilindro com raio {dims['radius']:g} e altura {dims['height']:g}."
+    elif kind == 'box' and {'length', 'width', 'height'} <= dims.keys():
+        parameters = {"box_length": dims['length'], "box_width": dims['width'], "box_height": dims['height']}
+        code = "result = cq.Workplane('XY').box(box_length, box_width, box_height)"
+        text = f"Criando uma caixa de {dims['length']:g} x {dims['width']:g} x {dims['height']:g}."
+    elif kind == 'sphere' and 'radius' in dims:
+        parameters = {"sphere_radius": dims['radius']}
+        code = "result = cq.Workplane('XY').sphere(sphere_radius)"
+        text = f"Criando uma esfera com raio {dims['radius']:g}."
+    elif kind == 'cone' and {'radius', 'height'} <= dims.keys():
+        # Workplane não tem primitiva de cone: sólido criado com Solid.makeCone (topo em ponta)
+        parameters = {"cone_height": dims['height'], "cone_radius": dims['radius']}
+        code = "result = cq.Workplane('XY').add(cq.Solid.makeCone(cone_radius, 0, cone_height))"
+        text = f"Criando um cone com raio {dims['radius']:g} e altura {dims['height']:g}."
+    else:
+        return None
+    
+    return LLMResponse(
+        intention_type="creation",
+        response_text=text,
+        execution_plan=ExecutionPlan(
+            description=f"Create parametric {kind}",
+            ast_nodes=[],
+            cadquery_code=code,
+            parameters=parameters,
+            new_parameters=dict(parameters)
+        ),
+        confidence=1.0
+    )
 
-        self.current_model_name = 'gemini-2.5-flash'
-        self.model = genai.GenerativeModel(
-            self.current_model_name,
-            generation_config=self.generation_config
-        )
-        
-        logger.info(f"🤖 GEMINI INITIALIZED - Model: {self.current_model_name}")
-        
-    def _initialize_ollama(self):
-        """Inicializa configuração do Ollama"""
-        # Verificar se modelo foi configurado
-        if not self.ollama_model:
-            raise ValueError("OLLAMA_MODEL não configurado. Configure OLLAMA_MODEL no arquivo .env com o nome do modelo desejado.")
-        
-        self.current_model_name = self.ollama_model
-        
-        # Ollama não usa generation_config, mas vamos criar um placeholder para compatibilidade
-        self.generation_config = None
-        self.model = None  # Ollama não precisa de objeto model
-        
-        # Verificar se Ollama está disponível
+# Resultados de validação de planos mantidos em cache (LRU pelo conteúdo relevante dos nós)
+VALIDATION_CACHE_SIZE = 256
+
+# Cache de respostas do LLM (LRU + TTL) indexado pelo hash de provider, modelo e prompt
+LLM_RESPONSE_CACHE_SIZE = 2048
+LLM_RESPONSE_CACHE_TTL = timedelta(days=7)
+
+# Limite do estado do modelo serializado no prompt; acima dele envia-se um resumo
+MODEL_STATE_PROMPT_MAX_CHARS = 20_000
+MODEL_STATE_SUMMARY_MAX_ITEMS = 50
+
+# Quantidade de mensagens do histórico incluídas no prompt e rótulos por tipo de mensagem
+HISTORY_MESSAGES_IN_PROMPT = 5
+# Orçamento do histórico no prompt (~4 caracteres por token => ~2000 tokens)
+HISTORY_PROMPT_MAX_CHARS = 8_000
+_HISTORY_ROLE_LABELS = {'user_input': 'Usuário'}
+
+# Objeto JSON dentro de um code block markdown (```json ... ```) nas respostas do LLM
+_RE_FENCED_JSON = re.compile(r'```(?:json|JSON)?\s*(\{.*?\})\s*```', re.DOTALL)
+# Vírgula antes de fechar objeto/array, erro comum em modelos locais
+_RE_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+def _summarize_state(value: Any, max_items: int = MODEL_STATE_SUMMARY_MAX_ITEMS) -> Any:
+    """Resume recursivamente o estado mantendo apenas os últimos itens de listas e dicionários grandes"""
+    if isinstance(value, dict):
+        items = list(value.items())
+        summary = {key: _summarize_state(item, max_items) for key, item in items[-max_items:]}
+        if len(items) > max_items:
+            summary["_omitted_items"] = len(items) - max_items
+        return summary
+    if isinstance(value, (list, tuple)):
+        summary = [_summarize_state(item, max_items) for item in value[-max_items:]]
+        if len(value) > max_items:
+            summary.insert(0, f"... {len(value) - max_items} itens omitidos")
+        return summary
+    return value
+
+def _format_model_state(state: Optional[Dict[str, Any]]) -> str:
+    """Serializa o estado do modelo para o prompt, resumindo-o quando excede o limite"""
+    if not state:
+        return 'No active model'
+    
+    serialized = safe_json_dumps(state, indent=2)
+    if len(serialized) <= MODEL_STATE_PROMPT_MAX_CHARS:
+        return serialized
+    return safe_json_dumps(_summarize_state(state), indent=2)
+
+# Decodificador usado para localizar um objeto JSON embutido em texto livre
+_JSON_DECODER = json.JSONDecoder()
+
+# Decodificador JSON usado nos caminhos quentes (orjson.JSONDecodeError herda de json.JSONDecodeError)
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# Valores aceitos para tipo de nó e parâmetros obrigatórios por operação na validação do plano
+_AST_NODE_TYPE_VALUES = frozenset(e.value for e in ASTNodeType)
+_REQUIRED_NODE_FIELDS = ("id", "node_type", "operation", "parameters")
+_REQUIRED_PARAMS: Dict[str, frozenset] = {
+    "cylinder": frozenset(("radius", "height")),
+}
+
+def _raw_decode_first(text: str) -> Optional[Tuple[str, Any]]:
+    """Decodifica o primeiro objeto JSON válido a partir de algum '{' do texto"""
+    idx = text.find('{')
+    while idx != -1:
         try:
-            response = requests.get(f"{self.ollama_base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                available_models = response.json().get('models', [])
-                model_names = [model.get('name', '') for model in available_models]
-                
-                logger.info(f"📋 OLLAMA - Modelos disponíveis: {model_names}")
-                
-                # Verificar se o modelo solicitado está disponível
-                if self.current_model_name not in model_names:
-                    logger.error(f"❌ OLLAMA - Modelo '{self.current_model_name}' não encontrado")
-                    logger.info(f"💡 OLLAMA - Para instalar o modelo, execute:")
-                    logger.info(f"   ollama pull {self.current_model_name}")
-                    
-                    # Tentar usar o primeiro modelo disponível como fallback
-                    if model_names:
-                        self.current_model_name = model_names[0]
-                        logger.info(f"🔄 OLLAMA - Usando modelo fallback: {self.current_model_name}")
-                    else:
-                        raise ValueError("Nenhum modelo disponível no Ollama. Execute 'ollama pull <modelo>' para instalar um modelo.")
-                
-                logger.info(f"🤖 OLLAMA INITIALIZED - Model: {self.current_model_name}")
-                logger.info(f"🌐 OLLAMA - Server: {self.ollama_base_url}")
-                
-            else:
-                raise ValueError(f"Ollama não disponível em {self.ollama_base_url}. Verifique se o serviço está rodando com 'ollama serve'")
-                
-        except requests.exceptions.RequestException as e:
-            raise ValueError(f"Erro ao conectar com Ollama em {self.ollama_base_url}: {e}. Verifique se o Ollama está rodando com 'ollama serve'")
-        
-    def _save_llm_interaction(self, prompt: str, response: str, context: str = "plan_generation") -> str:
-        """
-        Salva interação com LLM (prompt + resposta) em arquivo para análise.
+            data, end = _JSON_DECODER.raw_decode(text, idx)
+            return text[idx:end], data
+        except json.JSONDecodeError:
+            idx = text.find('{', idx + 1)
+    return None
+
+# Caracteres que alteram o estado da varredura incremental de JSON em streaming
+_RE_JSON_STREAM_TOKENS = re.compile(r'[{}"\\]')
+_THINK_OPEN = '<think>'
+_THINK_CLOSE = '</think>'
+
+class _StreamingJsonScanner:
+    """
+    Detecta o fim do primeiro objeto JSON de nível superior numa resposta em streaming.
+    Cada trecho é varrido uma única vez (profundidade de chaves e estado de string
+    mantidos entre trechos) e o texto só é unido e decodificado quando a profundidade
+    volta a zero. Blocos <think>...</think> de raciocínio são ignorados.
+    """
+    
+    __slots__ = ('_parts', '_length', '_tail', '_in_think', '_start',
+                 '_depth', '_in_string', '_escape')
+    
+    def __init__(self):
+        self._parts: List[str] = []
+        self._length = 0
+        self._tail = ''
+        self._in_think = False
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+    
+    def text(self) -> str:
+        return ''.join(self._parts)
+    
+    def feed(self, chunk: str) -> Optional[str]:
+        """Acrescenta um trecho; retorna o JSON completo assim que ele se fecha"""
+        self._parts.append(chunk)
+        offset = self._length
+        self._length += len(chunk)
+        pos = 0
+        size = len(chunk)
         
-        Args:
-            prompt: Prompt enviado ao LLM
-            response: Resposta recebida do LLM
-            context: Contexto da interação
-            
-        Returns:
-            Caminho do arquivo salvo
-        """
-        try:
-            # Criar timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        while pos < size:
+            if self._depth == 0:
+                # Fora do objeto: procurar tags de raciocínio e a chave de abertura
+                # (a cauda do trecho anterior cobre tags partidas entre trechos)
+                tail = self._tail
+                window = tail + chunk[pos:]
+                if self._in_think:
+                    close = window.find(_THINK_CLOSE)
+                    if close == -1:
+                        self._tail = window[-(len(_THINK_CLOSE) - 1):]
+                        return None
+                    pos += close + len(_THINK_CLOSE) - len(tail)
+                    self._tail = ''
+                    self._in_think = False
+                    continue
+                brace = window.find('{')
+                think = window.find(_THINK_OPEN)
+                if think != -1 and (brace == -1 or think < brace):
+                    pos += think + len(_THINK_OPEN) - len(tail)
+                    self._tail = ''
+                    self._in_think = True
+                    continue
+                if brace == -1:
+                    self._tail = window[-(len(_THINK_OPEN) - 1):]
+                    return None
+                pos += brace - len(tail)
+                self._tail = ''
+                self._start = offset + pos
+                self._depth = 1
+                self._in_string = False
+                self._escape = False
+                pos += 1
+                continue
             
-            # Criar nome do arquivo
-            filename = f"{timestamp}_{context}_{self.llm_provider}.json"
-            file_path = self.llm_responses_dir / filename
+            # Dentro do objeto: só os caracteres estruturais são inspecionados
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+            for match in _RE_JSON_STREAM_TOKENS.finditer(chunk, pos):
+                idx = match.start()
+                if idx < pos:
+                    continue  # caractere escapado já consumido
+                char = chunk[idx]
+                pos = idx + 1
+                if self._in_string:
+                    if char == '\\':
+                        if pos == size:
+                            self._escape = True
+                        pos += 1
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char == '{':
+                    self._depth += 1
+                elif char == '}':
+                    self._depth -= 1
+                    if self._depth == 0:
+                        break
+            else:
+                return None
             
-            # Criar estrutura de dados
-            interaction_data = {
-                "timestamp": datetime.now().isoformat(),
-                "context": context,
-                "llm_provider": self.llm_provider,
-                "model": self.current_model_name,
-                "prompt": prompt,
-                "response": response,
-                "prompt_length": len(prompt),
-                "response_length": len(response)
+            # Profundidade voltou a zero: decodificar uma única vez o candidato
+            candidate = ''.join(self._parts)[self._start:offset + pos]
+            try:
+                data = _json_loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and data:
+                return candidate
+        return None
+
+def _quick_structural_ok(text: str) -> bool:
+    """
+    Pré-verificação barata (contagens em C) antes de um parse completo.
+    Chaves dentro de strings podem reprovar um JSON válido; nesse caso as
+    estratégias seguintes de extração ainda o encontram.
+    """
+    return text[:1] == '{' and text[-1:] == '}' and text.count('{') == text.count('}')
+
+# Resposta de erro usada quando não se consegue extrair JSON do LLM (montada e serializada uma única vez)
+_JSON_EXTRACTION_ERROR_DATA = {
+    "intention_type": "error",
+    "response_text": "Erro: Não foi possível extrair JSON válido da resposta do LLM",
+    "requires_clarification": True,
+    "clarification_questions": ["Por favor, reformule sua solicitação de forma mais específica."]
+}
+_JSON_EXTRACTION_ERROR = safe_json_dumps(_JSON_EXTRACTION_ERROR_DATA)
+
+# Schema JSON esperado na resposta do LLM (expandido para permitir código CadQuery direto)
+_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intention_type": {
+            "type": "string",
+            "enum": ["creation", "modification", "query", "error"]
+        },
+        "response_text": {
+            "type": "string",
+            "description": "Resposta em linguagem natural para o usuário"
+        },
+        "execution_plan": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "string"},
+                "description": {"type": "string"},
+                "cadquery_code": {
+                    "type": "string",
+                    "description": "Código CadQuery puro e completo para executar"
+                },
+                "parameters": {
+                    "type": "object",
+                    "description": "Dicionário de parâmetros nomeados"
+                },
+                "ast_nodes": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string"},
+                            "node_type": {
+                                "type": "string",
+                                "enum": ["primitive", "operation", "parameter"]
+                            },
+                            "operation": {"type": "string"},
+                            "parameters": {"type": "object"},
+                            "position": {
+                                "type": "object",
+                                "properties": {
+                                    "x": {"type": "number"},
+                                    "y": {"type": "number"},
+                                    "z": {"type": "number"}
+                                }
+                            },
+                            "children": {
+                                "type": "array",
+                                "items": {"type": "string"}
+                            },
+                            "metadata": {"type": "object"}
+                        },
+                        "required": ["id", "node_type", "operation", "parameters"]
+                    }
+                },
+                "new_parameters": {"type": "object"},
+                "affected_operations": {
+                    "type": "array",
+                    "items": {"type": "string"}
+                }
             }
-            
-            # Salvar arquivo JSON
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(interaction_data, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"Interação {self.llm_provider.upper()} salva: {file_path}")
-            return str(file_path)
-            
-        except Exception as e:
-            logger.error(f"Erro ao salvar interação {self.llm_provider.upper()}: {e}")
-            return ""
-    
-    def _load_cadquery_api_docs(self) -> str:
-        """Carrega documentação abrangente da API CadQuery para contexto do LLM"""
-        return """
+        },
+        "parameter_updates": {"type": "object"},
+        "requires_clarification": {"type": "boolean"},
+        "clarification_questions": {
+            "type": "array",
+            "items": {"type": "string"}
+        },
+        "confidence": {
+            "type": "number",
+            "minimum": 0,
+            "maximum": 1
+        }
+    },
+    "required": ["intention_type", "response_text"]
+}
+
+# Schema serializado uma única vez na importação
+_JSON_SCHEMA_STR = safe_json_dumps(_JSON_SCHEMA, indent=2)
+
+# Referência usada no prompt no lugar das seções enviadas ao cache de contexto
+_CACHED_CONTEXT_NOTE = "(provided in the cached context above)"
+
+# Documentação da API CadQuery incluída nos prompts (constante, montada uma única vez)
+_CADQUERY_API_DOCS = """
         # CadQuery API Completa para Engenharia Mecânica
 
         ## Primitivas Básicas:
@@ -391,6 +713,589 @@ class PlanningModule:
 
         Esta documentação permite criar componentes mecânicos profissionais com CadQuery.
         """
+
+# Templates dos prompts, montados uma única vez e preenchidos com str.format
+# Prompt principal dividido em prefixo estático (idêntico entre chamadas, favorecendo o cache
+# implícito de prefixo do Gemini) e sufixo dinâmico com o pedido e o contexto da sessão
+_PROMPT_STATIC_TEMPLATE = """
+# ROLE: Expert CAD Design Assistant with CadQuery
+
+## Available CadQuery Operations
+{api_docs}
+
+# THINKING PROCESS (Chain-of-Thought):
+Before generating the JSON response, think through these steps:
+1. **Analyze Request**: What does the user want to create or modify?
+2. **Identify Type**: Is this creation, modification, query, or error handling?
+3. **Plan Operations**: What CadQuery operations are needed?
+4. **Parameter Setup**: What parameters should be configurable?
+5. **Validation**: Does this plan make geometric sense?
+
+# FEW-SHOT EXAMPLES:
+
+## Example 1 - Simple Cylinder with Direct CadQuery Code:
+User Request: "Create a cylinder with radius 10 and height 20"
+
+Correct JSON Response:
+{{
+    "intention_type": "creation",
+    "response_text": "I'll create a cylinder with the specified dimensions using parametric CadQuery code.",
+    "execution_plan": {{
+        "id": "cylinder_creation_001",
+        "description": "Create parametric cylinder",
+        "cadquery_code": "result = cq.Workplane('XY').cylinder(cylinder_height, cylinder_radius)",
+        "parameters": {{
+            "cylinder_height": 20.0,
+            "cylinder_radius": 10.0
+        }},
+        "new_parameters": {{
+            "cylinder_height": 20.0,
+            "cylinder_radius": 10.0
+        }}
+    }},
+    "requires_clarification": false,
+    "confidence": 0.95
+}}
+
+## Example 2 - Screw with Safe Fillet:
+User Request: "Create a screw with curved head using fillet"
+
+Correct JSON Response:
+{{
+    "intention_type": "creation",
+    "response_text": "I'll create a screw with a curved head using safe fillet techniques.",
+    "execution_plan": {{
+        "id": "safe_fillet_screw",
+        "description": "Create screw with safe fillet on head",
+        "cadquery_code": "# Create screw body\\nscrew_body = cq.Workplane('XY').cylinder(body_length, body_diameter/2)\\n\\n# Create screw head\\nscrew_head = cq.Workplane('XY').cylinder(head_height, head_diameter/2)\\n\\n# Calculate safe fillet radius\\nsafe_fillet_radius = min(fillet_radius, head_height/2, (head_diameter - body_diameter)/4)\\n\\n# Apply safe fillet to head edges\\nscrew_head = screw_head.edges().fillet(safe_fillet_radius)\\n\\n# Position head on body\\nscrew_head = screw_head.translate((0, 0, body_length))\\n\\n# Combine parts\\nresult = screw_body.union(screw_head)",
+        "parameters": {{
+            "body_diameter": 6.0,
+            "body_length": 20.0,
+            "head_diameter": 10.0,
+            "head_height": 4.0,
+            "fillet_radius": 2.0
+        }},
+        "new_parameters": {{
+            "body_diameter": 6.0,
+            "body_length": 20.0,
+            "head_diameter": 10.0,
+            "head_height": 4.0,
+            "fillet_radius": 2.0
+        }}
+    }},
+    "requires_clarification": false,
+    "confidence": 0.95
+}}
+
+## Example 3 - Bearing with Advanced CadQuery Operations:
+User Request: "Create a ball bearing 6200 with outer ring, inner ring, and balls"
+
+Correct JSON Response:
+{{
+    "intention_type": "creation",
+    "response_text": "I'll create a complete ball bearing 6200 with all components.",
+    "execution_plan": {{
+        "id": "bearing_6200_complete",
+        "description": "Create ball bearing with outer ring, inner ring, and balls",
+        "cadquery_code": "import math\\n\\n# Outer ring\\nouter_ring = (cq.Workplane('XY')\\n              .cylinder(bearing_width, bearing_od/2)\\n              .cylinder(bearing_width, (bearing_od - ball_diameter)/2, combine=False))\\n\\n# Inner ring\\ninner_ring = (cq.Workplane('XY')\\n              .cylinder(bearing_width, (bearing_id + ball_diameter)/2)\\n              .cylinder(bearing_width, bearing_id/2, combine=False))\\n\\n# Ball pitch circle\\npitch_radius = (bearing_od - bearing_id - ball_diameter) / 2 + bearing_id/2\\n\\n# Create single ball\\nball = cq.Workplane('XY').sphere(ball_diameter/2)\\n\\n# Create array of balls\\nballs = (cq.Workplane('XY')\\n         .center(pitch_radius, 0)\\n         .sphere(ball_diameter/2)\\n         .polarArray(radius=0, startAngle=0, angle=360, count=num_balls))\\n\\n# Combine all components\\nresult = outer_ring.union(inner_ring).union(balls)",
+        "parameters": {{
+            "bearing_od": 30.0,
+            "bearing_id": 10.0,
+            "bearing_width": 9.0,
+            "ball_diameter": 4.0,
+            "num_balls": 8
+        }},
+        "new_parameters": {{
+            "bearing_od": 30.0,
+            "bearing_id": 10.0,
+            "bearing_width": 9.0,
+            "ball_diameter": 4.0,
+            "num_balls": 8
+        }}
+    }},
+    "requires_clarification": false,
+    "confidence": 0.85
+}}
+
+## Example 4 - Cilindro com Furo Contextual (TÉCNICA CORRETA):
+User Request: "Create a cylinder with a hole through it"
+
+Correct JSON Response:
+{{
+    "intention_type": "creation",
+    "response_text": "I'll create a cylinder with a contextual hole using proper face selection to ensure correct positioning.",
+    "execution_plan": {{
+        "id": "contextual_hole_cylinder",
+        "description": "Create cylinder with contextual hole using face selection",
+        "cadquery_code": "# Create cylinder with base on XY plane (not centered)\\nbase_cylinder = cq.Workplane('XY').cylinder(cylinder_height, cylinder_radius, centered=False)\\n\\n# Select top face and create contextual hole\\nresult = base_cylinder.faces('>Z').hole(hole_diameter)",
+        "parameters": {{
+            "cylinder_height": 40.0,
+            "cylinder_radius": 20.0,
+            "hole_diameter": 8.0
+        }},
+        "new_parameters": {{
+            "cylinder_height": 40.0,
+            "cylinder_radius": 20.0,
+            "hole_diameter": 8.0
+        }}
+    }},
+    "requires_clarification": false,
+    "confidence": 0.95
+}}
+
+# JSON SCHEMA TO FOLLOW:
+{json_schema}
+
+# CRITICAL INSTRUCTIONS:
+1. **Output Format**: Return ONLY valid JSON - no markdown, no code blocks, no extra text. Omit empty arrays and empty objects (e.g. "ast_nodes", "affected_operations", "parameter_updates", "clarification_questions") - missing fields are treated as empty
+2. **CadQuery Code**: Use the "cadquery_code" field for direct CadQuery Python code
+3. **Parameter Names**: Always use descriptive variable names, never hardcoded values
+4. **Code Freedom**: You have TOTAL FREEDOM to use any CadQuery operations from the API documentation
+5. **Complex Geometries**: Feel free to create sophisticated mechanical components with multiple operations
+6. **Code Structure**: Use \\n for line breaks in cadquery_code, create intermediate variables as needed
+7. **Final Result**: Always assign the final geometry to a variable named 'result'
+8. **Imports**: Include necessary imports like 'import math' if needed within the cadquery_code
+9. **Real Engineering**: Create actual engineering components, not simplified primitives
+10. **FILETES SEGUROS**: SEMPRE use .edges() sem seletores específicos para filetes, e calcule raio máximo seguro
+11. **EVITAR SELETORES**: NUNCA use "|X", "|Y", "|Z" para arestas - use .edges() ou .faces().edges()
+
+# PROBLEMA CRÍTICO: AMBIGUIDADE DO "MODELO MENTAL" vs. LÓGICA DO CÓDIGO
+12. **FUROS CONTEXTUAIS**: Ao gerar código CadQuery para adicionar furos ou recortes, SEMPRE que possível, selecione primeiro a face de referência (ex: .faces('>Z')) antes de aplicar a operação (.hole(), .cut(), etc.). Isso garante que a operação seja aplicada corretamente em relação à geometria existente.
+
+**Exemplo CORRETO para furos:**
+```
+# 1. Criar cilindro com base no plano (não centralizado)
+base_cylinder = cq.Workplane("XY").cylinder(height, radius, centered=False)
+
+# 2. Selecionar face superior e fazer furo contextual
+result = base_cylinder.faces(">Z").hole(hole_diameter)
+```
+
+**Exemplo INCORRETO (evitar):**
+```
+# PROBLEMA: Furo "no vácuo" sem contexto da geometria
+cylinder = cq.Workplane("XY").cylinder(height, radius)
+hole = cq.Workplane("XY").hole(diameter)  # Posição ambígua!
+result = cylinder.cut(hole)
+```
+
+13. **POSICIONAMENTO EXPLÍCITO**: Para geometrias que devem apoiar em uma base (como cilindros com furos), use `centered=False` para posicionar a base no plano XY, eliminando ambiguidade de coordenadas.
+
+14. **OPERAÇÕES RELACIONAIS**: Sempre que uma operação depende de outra geometria existente (furos, chanfros, filetes), use seletores de face/aresta (.faces(">Z"), .edges()) para estabelecer contexto geométrico claro.
+""".strip()
+
+_PROMPT_DYNAMIC_TEMPLATE = """
+## User Request
+{user_request}
+
+## Conversation History
+{conversation_history}
+
+## Current Model State
+{model_state}
+
+Provide a response in JSON only.
+""".strip()
+
+_ERROR_CORRECTION_STATIC_TEMPLATE = """
+# ROLE: Expert CAD Error Diagnostician & Plan Corrector
+You are a specialized assistant for debugging and correcting CAD execution plans in CadQuery.
+Your expertise includes analyzing error messages and generating corrected execution plans.
+
+## Available CadQuery API:
+{api_docs}
+
+# THINKING PROCESS (Chain-of-Thought):
+Before generating the corrected JSON response, think through these steps:
+1. **Error Analysis**: What specific error occurred and why?
+2. **Root Cause**: What in the original plan caused this error?
+3. **API Validation**: Are we using CadQuery operations correctly?
+4. **Parameter Check**: Are all required parameters present and valid?
+5. **Logic Review**: Does the geometric operation sequence make sense?
+6. **Correction Strategy**: What specific changes are needed?
+
+## CRITICAL FILLET SAFETY RULES:
+- NEVER use "|X", "|Y", "|Z" selectors for edges
+- ALWAYS calculate safe_radius = min(desired_radius, dimension_constraints)
+- USE .edges() without selectors for reliable fillet application
+
+# CORRECTION INSTRUCTIONS:
+1. **Output Format**: Return ONLY valid JSON - no markdown, no code blocks, no extra text. Omit empty arrays and empty objects (e.g. "ast_nodes", "affected_operations", "parameter_updates", "clarification_questions") - missing fields are treated as empty
+2. **Preserve Intent**: Keep the original geometric intention intact
+3. **Fix Specific Error**: Address the exact error identified
+4. **Validate Logic**: Ensure the corrected plan makes geometric sense
+5. **Parameter Safety**: Use only valid CadQuery parameters
+""".strip()
+
+# Parte variável do prompt de correção (plano que falhou e erro), anexada ao prefixo estático
+_ERROR_CORRECTION_DYNAMIC_TEMPLATE = """
+# ERROR ANALYSIS CONTEXT:
+## Original Plan That Failed:
+{original_plan}
+
+## Error Message:
+{error_message}
+
+## Stack Trace:
+{error_traceback}
+
+# MATCHING ERROR PATTERNS & FIXES:
+{error_patterns}
+
+# YOUR TASK:
+Analyze the error systematically using the thinking process above, then generate a corrected JSON execution plan that resolves the specific error while maintaining the original design intent.
+
+Return ONLY the corrected JSON response, no additional text.
+""".strip()
+
+# Catálogo de erros comuns: (regex aplicada à mensagem/stack trace, trecho de correção enviado ao LLM).
+# Só os padrões reconhecidos entram no prompt de correção.
+_ERROR_PATTERNS = (
+    (re.compile(r"Fillets requires that edges be selected"), '''## Fillet Edge Selection Errors:
+Error: "Fillets requires that edges be selected"
+Fix: Use .edges() without specific selectors, calculate safe radius
+Example: "geometry.edges().fillet(safe_radius)"'''),
+    (re.compile(r"missing \d+ required positional argument"), """## Missing Parameters:
+Error: "missing 1 required positional argument"
+Fix: Add missing parameters to the operation"""),
+    (re.compile(r"centerOfMass\(\) missing"), """## Incorrect API Usage:
+Error: "centerOfMass() missing argument"
+Fix: Use correct API method like solid.centerOfMass() or CenterOfBoundBox()"""),
+    (re.compile(r"object has no attribute"), """## Invalid Object References:
+Error: "object has no attribute"
+Fix: Ensure target objects exist before operations"""),
+    (re.compile(r"expected 'except' or 'finally' block|SyntaxError|IndentationError"), """## Syntax Errors:
+Error: "expected 'except' or 'finally' block"
+Fix: Check code structure and indentation"""),
+)
+_NO_ERROR_PATTERN_MATCHED = "No known pattern matched; rely on the thinking process above."
+
+def _match_error_patterns(error_text: str) -> str:
+    """Seleciona os trechos de correção do catálogo que correspondem ao erro"""
+    matched = [fix for pattern, fix in _ERROR_PATTERNS if pattern.search(error_text)]
+    return "\n\n".join(matched) if matched else _NO_ERROR_PATTERN_MATCHED
+
+_AUTO_CORRECT_PROMPT_TEMPLATE = """
+O plano gerado tem erros de validação. Corrija-os:
+
+## PLANO ORIGINAL:
+{original_plan}
+
+## ERROS DE VALIDAÇÃO:
+{validation_errors}
+
+Gere um plano corrigido no mesmo formato JSON.
+""".strip()
+
+# Conteúdo fixo enviado uma única vez ao cache de contexto do Gemini
+_STATIC_PROMPT_CONTEXT = (
+    "# CADQUERY API DOCUMENTATION\n" + _CADQUERY_API_DOCS +
+    "\n# JSON SCHEMA TO FOLLOW:\n" + _JSON_SCHEMA_STR
+)
+
+class PlanningModule:
+    """
+    Módulo de Planejamento - Interface com LLMs (Gemini e Ollama) para gerar planos de ação.
+    Converte linguagem natural em árvores de execução abstratas (AST).
+    """
+    
+    def __init__(self):
+        # Configuração do provider de LLM
+        self.llm_provider = os.getenv("LLM_PROVIDER", "gemini").lower()  # gemini ou ollama
+        self.ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        self.ollama_model = os.getenv("OLLAMA_MODEL", "")
+        self.ollama_timeout = int(os.getenv("OLLAMA_TIMEOUT", "600"))  # 10 minutos por padrão
+        
+        # Configuração Gemini (manter compatibilidade)
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        
+        # Um GenerativeModel (e um cache de contexto) por nome de modelo
+        self._models: Dict[str, Any] = {}
+        self._model_lock = asyncio.Lock()
+        self._context_caches: Dict[str, Any] = {}
+        self._context_cache_expires: Dict[str, datetime] = {}
+        
+        # Inicializar o provider selecionado
+        if self.llm_provider == "ollama":
+            self._initialize_ollama()
+        else:
+            self._initialize_gemini()
+        
+        # Documentação da API CadQuery disponível para o LLM
+        self.cadquery_api_docs = _CADQUERY_API_DOCS
+        
+        # Diretório para salvar respostas do LLM
+        self.llm_responses_dir = Path("llm_responses")
+        self.llm_responses_dir.mkdir(exist_ok=True)
+        
+        # Arquivo JSONL único da sessão, aberto uma vez em modo append (uma linha por interação)
+        self.llm_log_path = self.llm_responses_dir / f"session_{os.getpid()}_{int(time.time())}.jsonl"
+        self._log_fp = open(self.llm_log_path, "ab", buffering=LLM_LOG_BUFFER_SIZE)
+        atexit.register(self._log_fp.close)
+        logger.info(f"Respostas do LLM serão salvas em: {self.llm_log_path.absolute()}")
+        
+        # Prefixos estáticos dos prompts já formatados, por template e uso ou não do cache de contexto
+        self._static_prompt_prefixes: Dict[Tuple[str, bool], str] = {}
+        
+        # Prompts já montados, indexados pelo hash das entradas que os determinam
+        self._prompt_cache: OrderedDict = OrderedDict()
+        
+        # Respostas finais de generate_plan indexadas pelo pedido normalizado e contexto
+        self._plan_cache: OrderedDict = OrderedDict()
+        
+        # Resultados de _validate_execution_plan indexados pelo conteúdo validado dos nós
+        self._validation_cache: OrderedDict = OrderedDict()
+        
+        # Respostas do LLM já parseadas com sucesso: chave -> (expiração, texto da resposta)
+        self._response_cache: OrderedDict = OrderedDict()
+        
+        # Limita chamadas simultâneas ao LLM (requisições concorrentes se sobrepõem à latência de rede)
+        self._llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENT_REQUESTS)
+        
+        # Threads dedicadas às chamadas bloqueantes ao LLM, sem disputar o executor padrão do loop
+        self._llm_executor = ThreadPoolExecutor(
+            max_workers=LLM_MAX_CONCURRENT_REQUESTS, thread_name_prefix="llm-io"
+        )
+        
+        # Fila de gravação das interações, consumida por uma task em segundo plano
+        self._save_queue: asyncio.Queue = asyncio.Queue(maxsize=LLM_SAVE_QUEUE_SIZE)
+        self._writer_task: Optional[asyncio.Task] = None
+        
+    def _initialize_gemini(self):
+        """Inicializa configuração do Gemini"""
+        if not self.api_key:
+            raise ValueError("GEMINI_API_KEY não encontrada nas variáveis de ambiente")
+        
+        genai.configure(api_key=self.api_key)
+        
+        self.generation_config = genai.types.GenerationConfig(
+            temperature=0.1,
+            response_mime_type="application/json",
+            max_output_tokens=LLM_MAX_OUTPUT_TOKENS
+        )
+
+        # O modelo (e seu cache de contexto, criado via rede) é montado na primeira
+        # consulta, fora do loop de eventos
+        self.current_model_name = 'gemini-2.5-flash'
+        
+        logger.info(f"🤖 GEMINI INITIALIZED - Model: {self.current_model_name}")
+    
+    async def _run_blocking(self, func, *args):
+        """Executa chamada bloqueante à API do Gemini nas threads de I/O do LLM, sem travar o loop"""
+        return await asyncio.get_running_loop().run_in_executor(self._llm_executor, func, *args)
+    
+    async def _get_model(self, model_name: str):
+        """Retorna o GenerativeModel do nome informado, criando-o (com cache de contexto) uma única vez"""
+        model = self._models.get(model_name)
+        if model is None:
+            async with self._model_lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = self._models[model_name] = await self._run_blocking(self._create_model, model_name)
+        return model
+    
+    def _create_model(self, model_name: str):
+        """
+        Envia documentação e schema ao cache de contexto do Gemini e cria o modelo a partir dele.
+        Se o cache não puder ser criado, usa o modelo sem cache (prompt completo).
+        """
+        try:
+            cache = genai.caching.CachedContent.create(
+                model=f"models/{model_name}",
+                display_name="cadquery-planning-context",
+                contents=[_STATIC_PROMPT_CONTEXT],
+                ttl=GEMINI_CONTEXT_CACHE_TTL
+            )
+            model = genai.GenerativeModel.from_cached_content(
+                cached_content=cache,
+                generation_config=self.generation_config
+            )
+            self._context_caches[model_name] = cache
+            self._context_cache_expires[model_name] = datetime.now() + GEMINI_CONTEXT_CACHE_TTL
+            logger.info(f"🗄️  GEMINI - Context cache created for {model_name}")
+            return model
+        except Exception as e:
+            logger.warning(f"⚠️  GEMINI - Context cache unavailable for {model_name}, sending full prompts: {e}")
+            return genai.GenerativeModel(
+                model_name,
+                generation_config=self.generation_config
+            )
+    
+    async def _ensure_context_cache(self):
+        """Garante o modelo atual e renova o TTL do cache de contexto antes de expirar (recria se a renovação falhar)"""
+        model_name = self.current_model_name
+        if self.llm_provider == "ollama":
+            return
+        
+        await self._get_model(model_name)
+        cache = self._context_caches.get(model_name)
+        if cache is None:
+            return
+        
+        if datetime.now() < self._context_cache_expires[model_name] - GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+            return
+        
+        try:
+            await self._run_blocking(lambda: cache.update(ttl=GEMINI_CONTEXT_CACHE_TTL))
+            self._context_cache_expires[model_name] = datetime.now() + GEMINI_CONTEXT_CACHE_TTL
+        except Exception as e:
+            logger.warning(f"⚠️  GEMINI - Could not refresh context cache, recreating: {e}")
+            await self._drop_model(model_name)
+            await self._get_model(model_name)
+    
+    async def _drop_model(self, model_name: str):
+        """Descarta o modelo e o cache de contexto associados ao nome"""
+        self._models.pop(model_name, None)
+        self._context_cache_expires.pop(model_name, None)
+        cache = self._context_caches.pop(model_name, None)
+        if cache is not None:
+            try:
+                await self._run_blocking(cache.delete)
+            except Exception as e:
+                logger.debug(f"Erro ao remover cache de contexto: {e}")
+    
+    def _has_context_cache(self) -> bool:
+        """Indica se o modelo atual usa cache de contexto"""
+        return self.current_model_name in self._context_caches
+    
+    def _api_docs_section(self) -> str:
+        """Documentação CadQuery para o prompt (omitida quando está no cache de contexto)"""
+        return _CACHED_CONTEXT_NOTE if self._has_context_cache() else self.cadquery_api_docs
+    
+    def _json_schema_section(self) -> str:
+        """Schema JSON para o prompt (omitido quando está no cache de contexto)"""
+        return _CACHED_CONTEXT_NOTE if self._has_context_cache() else _JSON_SCHEMA_STR
+        
+    def _initialize_ollama(self):
+        """Inicializa configuração do Ollama"""
+        # Verificar se modelo foi configurado
+        if not self.ollama_model:
+            raise ValueError("OLLAMA_MODEL não configurado. Configure OLLAMA_MODEL no arquivo .env com o nome do modelo desejado.")
+        
+        self.current_model_name = self.ollama_model
+        
+        # Ollama não usa generation_config, mas vamos criar um placeholder para compatibilidade
+        self.generation_config = None  # Ollama não precisa de objetos model
+        
+        # Verificar se Ollama está disponível (lista de modelos reaproveitada por alguns segundos)
+        try:
+            cached = _OLLAMA_TAGS_CACHE.get(self.ollama_base_url)
+            if cached is not None and time.monotonic() - cached[0] < OLLAMA_TAGS_CACHE_TTL:
+                model_names = cached[1]
+            else:
+                response = _ollama_session().get(f"{self.ollama_base_url}/api/tags", timeout=5)
+                if response.status_code != 200:
+                    raise ValueError(f"Ollama não disponível em {self.ollama_base_url}. Verifique se o serviço está rodando com 'ollama serve'")
+                
+                available_models = response.json().get('models', [])
+                model_names = [model.get('name', '') for model in available_models]
+                _OLLAMA_TAGS_CACHE[self.ollama_base_url] = (time.monotonic(), model_names)
+            
+            logger.info(f"📋 OLLAMA - Modelos disponíveis: {model_names}")
+            
+            # Verificar se o modelo solicitado está disponível
+            if self.current_model_name not in model_names:
+                logger.error(f"❌ OLLAMA - Modelo '{self.current_model_name}' não encontrado")
+                logger.info(f"💡 OLLAMA - Para instalar o modelo, execute:")
+                logger.info(f"   ollama pull {self.current_model_name}")
+                
+                # Tentar usar o primeiro modelo disponível como fallback
+                if model_names:
+                    self.current_model_name = model_names[0]
+                    logger.info(f"🔄 OLLAMA - Usando modelo fallback: {self.current_model_name}")
+                else:
+                    raise ValueError("Nenhum modelo disponível no Ollama. Execute 'ollama pull <modelo>' para instalar um modelo.")
+            
+            logger.info(f"🤖 OLLAMA INITIALIZED - Model: {self.current_model_name}")
+            logger.info(f"🌐 OLLAMA - Server: {self.ollama_base_url}")
+            
+            self._preload_ollama_model()
+                
+        except requests.exceptions.RequestException as e:
+            raise ValueError(f"Erro ao conectar com Ollama em {self.ollama_base_url}: {e}. Verifique se o Ollama está rodando com 'ollama serve'")
+        
+    def _save_llm_interaction(self, prompt: str, response: str, context: str = "plan_generation") -> str:
+        """
+        Enfileira interação com LLM (prompt + resposta) para gravação no JSONL da sessão.
+        A escrita em disco é feita fora do event loop pela task _drain_saves.
+        
+        Args:
+            prompt: Prompt enviado ao LLM
+            response: Resposta recebida do LLM
+            context: Contexto da interação
+            
+        Returns:
+            Caminho do arquivo JSONL onde a interação será registrada
+        """
+        try:
+            # Criar estrutura de dados
+            interaction_data = {
+                "timestamp": datetime.now().isoformat(),
+                "context": context,
+                "llm_provider": self.llm_provider,
+                "model": self.current_model_name,
+                "prompt": prompt,
+                "response": response,
+                "prompt_length": len(prompt),
+                "response_length": len(response)
+            }
+            
+            # Enfileirar para o writer em segundo plano
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # Fora do event loop: gravar diretamente
+                self._flush_interactions([interaction_data])
+                return str(self.llm_log_path)
+            
+            if self._writer_task is None or self._writer_task.done():
+                self._writer_task = asyncio.create_task(self._drain_saves())
+            
+            self._save_queue.put_nowait(interaction_data)
+            return str(self.llm_log_path)
+            
+        except asyncio.QueueFull:
+            logger.warning(f"Fila de gravação cheia, interação {self.llm_provider.upper()} descartada")
+            return ""
+        except Exception as e:
+            logger.error(f"Erro ao salvar interação {self.llm_provider.upper()}: {e}")
+            return ""
+    
+    async def _drain_saves(self):
+        """Consome a fila de interações e grava os arquivos em lotes numa thread"""
+        while True:
+            batch = [await self._save_queue.get()]
+            
+            # Acumular mais itens por um curto intervalo para amortizar a troca de thread
+            try:
+                while len(batch) < LLM_SAVE_BATCH_SIZE:
+                    batch.append(await asyncio.wait_for(self._save_queue.get(), LLM_SAVE_BATCH_WAIT))
+            except asyncio.TimeoutError:
+                pass
+            
+            await asyncio.to_thread(self._flush_interactions, batch)
+            for _ in batch:
+                self._save_queue.task_done()
+    
+    def _flush_interactions(self, batch: List[Dict[str, Any]]):
+        """Acrescenta um lote de interações ao JSONL da sessão, uma linha por interação"""
+        for interaction_data in batch:
+            try:
+                if orjson is not None:
+                    line = orjson.dumps(interaction_data)
+                else:
+                    line = json.dumps(interaction_data, ensure_ascii=False).encode('utf-8')
+                self._log_fp.write(line + b"\n")
+                
+                logger.info(f"Interação {interaction_data['llm_provider'].upper()} salva: {self.llm_log_path}")
+                
+            except Exception as e:
+                logger.error(f"Erro ao salvar interação {interaction_data['llm_provider'].upper()}: {e}")
+        
+        try:
+            self._log_fp.flush()
+        except Exception as e:
+            logger.error(f"Erro ao gravar log de interações: {e}")
     
     async def generate_plan(self, query: Dict[str, Any]) -> LLMResponse:
         """
@@ -412,19 +1317,47 @@ class PlanningModule:
                 # Para Gemini, permitir mudança via frontend
                 model_choice = query.get('model_choice') or self.current_model_name
                 if model_choice != self.current_model_name:
-                    self._initialize_model(model_choice)
+                    await self._initialize_model(model_choice)
+                else:
+                    await self._ensure_context_cache()
+
+            # Primitivas simples em uma sessão sem modelo: plano montado sem chamar o LLM
+            if query.get('request_type') != 'error_correction' and not query.get('current_model_state'):
+                deterministic = _try_deterministic_plan(query.get('user_request', ''))
+                if deterministic is not None:
+                    logger.info("✅ PLANNING - Deterministic plan for simple primitive request")
+                    return deterministic
+
+            # Pedido equivalente já planejado com o mesmo contexto: reaproveitar plano validado
+            plan_key = None
+            if query.get('request_type') != 'error_correction':
+                plan_key = self._plan_cache_key(query)
+                cached_plan = self._plan_cache.get(plan_key)
+                if cached_plan is not None:
+                    self._plan_cache.move_to_end(plan_key)
+                    logger.info(f"✅ PLANNING - Reusing cached plan ({self.llm_provider.upper()}, cache_hit=True)")
+                    return cached_plan.model_copy(deep=True)
 
             # Construir prompt estruturado para o LLM
             prompt = self._build_prompt(query)
             
-            # Fazer chamada para o LLM
-            response = await self._call_llm(prompt, "plan_generation")
+            # Fazer chamada para o LLM (ou reaproveitar resposta em cache); correções de erro
+            # são novas tentativas e sempre consultam o LLM, para não repetir a mesma correção ruim
+            is_correction = query.get('request_type') == 'error_correction'
+            response = await self._call_llm(prompt, "plan_generation", use_cache=not is_correction)
             
             # Parsear resposta do LLM
             llm_response = self._parse_llm_response(response)
             
             # Validar plano de execução se presente
-            if llm_response.execution_plan:
+            # (checagem rápida com parada no primeiro erro; relatório completo só se inválido)
+            plan_ok = llm_response.execution_plan is None or self._is_valid_plan(llm_response.execution_plan)
+            
+            # Resposta bruta só entra no cache depois de parseada e validada
+            if not is_correction and plan_ok and llm_response.intention_type != "error":
+                self._store_cached_response(prompt, response)
+            
+            if not plan_ok:
                 validation = self._validate_execution_plan(llm_response.execution_plan)
                 if not validation.is_valid:
                     logger.warning(f"Plano inválido: {validation.errors}")
@@ -433,6 +1366,15 @@ class PlanningModule:
                         query, llm_response, validation
                     )
             
+            # Só entram no cache respostas sem plano ou cujo plano final passa na validação
+            # (auto-correções não revalidadas e a resposta original devolvida em falha ficam de fora)
+            final_plan = llm_response.execution_plan
+            if (plan_key is not None and llm_response.intention_type != "error"
+                    and (final_plan is None or self._is_valid_plan(final_plan))):
+                self._plan_cache[plan_key] = llm_response.model_copy(deep=True)
+                if len(self._plan_cache) > PLAN_CACHE_SIZE:
+                    self._plan_cache.popitem(last=False)
+            
             logger.info(f"✅ PLANNING - Successfully generated plan using {self.llm_provider.upper()}")
             return llm_response
             
@@ -444,377 +1386,183 @@ class PlanningModule:
                 requires_clarification=False
             )
     
+    async def generate_plan_batch(self, queries: List[Dict[str, Any]]) -> List[LLMResponse]:
+        """
+        Gera planos para várias consultas (ex.: regeneração offline), na mesma ordem recebida.
+        
+        As consultas são agrupadas por modelo: cada grupo roda em paralelo, limitado pelo
+        semáforo de chamadas ao LLM, e os grupos rodam um após o outro, já que trocar de
+        modelo altera o estado compartilhado (current_model_name). Consultas repetidas
+        aproveitam os caches de plano e de respostas.
+        
+        Args:
+            queries: Lista de consultas no mesmo formato aceito por generate_plan
+        """
+        # Ollama ignora model_choice: todas as consultas formam um único grupo
+        groups: Dict[Optional[str], List[int]] = {}
+        for index, query in enumerate(queries):
+            model = None if self.llm_provider == "ollama" else (query.get('model_choice') or self.current_model_name)
+            groups.setdefault(model, []).append(index)
+        
+        results: List[Optional[LLMResponse]] = [None] * len(queries)
+        for model, indices in groups.items():
+            # Fixar o modelo resolvido: consultas sem model_choice não devem herdar o do grupo anterior
+            group_queries = [queries[i] if model is None else {**queries[i], 'model_choice': model} for i in indices]
+            responses = await asyncio.gather(*(self.generate_plan(query) for query in group_queries))
+            for i, response in zip(indices, responses):
+                results[i] = response
+        return results
+
+    def clear_cache(self):
+        """Descarta planos e respostas do LLM em cache, forçando nova geração nas próximas consultas"""
+        self._plan_cache.clear()
+        self._response_cache.clear()
+        logger.info("🧹 Caches de planos e respostas do LLM limpos")
+
     def _build_prompt(self, query: Dict[str, Any]) -> str:
-        """Constrói prompt estruturado para o LLM com schema JSON definido"""
+        """Constrói prompt estruturado para o LLM com schema JSON definido (com cache LRU)"""
+        key = self._prompt_cache_key(query)
+        prompt = self._prompt_cache.get(key)
+        if prompt is not None:
+            self._prompt_cache.move_to_end(key)
+            return prompt
         
-        # Schema JSON expandido para permitir código CadQuery direto
-        json_schema = {
-            "type": "object",
-            "properties": {
-                "intention_type": {
-                    "type": "string",
-                    "enum": ["creation", "modification", "query", "error"]
-                },
-                "response_text": {
-                    "type": "string",
-                    "description": "Resposta em linguagem natural para o usuário"
-                },
-                "execution_plan": {
-                    "type": "object",
-                    "properties": {
-                        "id": {"type": "string"},
-                        "description": {"type": "string"},
-                        "cadquery_code": {
-                            "type": "string",
-                            "description": "Código CadQuery puro e completo para executar"
-                        },
-                        "parameters": {
-                            "type": "object",
-                            "description": "Dicionário de parâmetros nomeados"
-                        },
-                        "ast_nodes": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "id": {"type": "string"},
-                                    "node_type": {
-                                        "type": "string",
-                                        "enum": ["primitive", "operation", "parameter"]
-                                    },
-                                    "operation": {"type": "string"},
-                                    "parameters": {"type": "object"},
-                                    "position": {
-                                        "type": "object",
-                                        "properties": {
-                                            "x": {"type": "number"},
-                                            "y": {"type": "number"},
-                                            "z": {"type": "number"}
-                                        }
-                                    },
-                                    "children": {
-                                        "type": "array",
-                                        "items": {"type": "string"}
-                                    },
-                                    "metadata": {"type": "object"}
-                                },
-                                "required": ["id", "node_type", "operation", "parameters"]
-                            }
-                        },
-                        "new_parameters": {"type": "object"},
-                        "affected_operations": {
-                            "type": "array",
-                            "items": {"type": "string"}
-                        }
-                    }
-                },
-                "parameter_updates": {"type": "object"},
-                "requires_clarification": {"type": "boolean"},
-                "clarification_questions": {
-                    "type": "array",
-                    "items": {"type": "string"}
-                },
-                "confidence": {
-                    "type": "number",
-                    "minimum": 0,
-                    "maximum": 1
-                }
-            },
-            "required": ["intention_type", "response_text"]
-        }
+        prompt = self._render_prompt(query)
+        self._prompt_cache[key] = prompt
+        if len(self._prompt_cache) > PROMPT_CACHE_SIZE:
+            self._prompt_cache.popitem(last=False)
+        return prompt
+    
+    def _plan_cache_key(self, query: Dict[str, Any]) -> bytes:
+        """Hash do pedido e do histórico normalizados, do estado do modelo e do LLM em uso"""
+        recent = islice(reversed(query.get('conversation_history') or []), HISTORY_MESSAGES_IN_PROMPT)
+        inputs = [
+            self.llm_provider, self.current_model_name,
+            _normalize_request(query.get('user_request') or ''),
+            [(msg.get('message_type'), _normalize_request(msg.get('content') or '')) for msg in recent],
+            query.get('current_model_state')
+        ]
+        serialized = safe_json_dumps(inputs, sort_keys=True)
+        return hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).digest()
+    
+    def _prompt_cache_key(self, query: Dict[str, Any]) -> bytes:
+        """Hash estável das entradas que determinam o texto do prompt"""
+        if query.get('request_type') == 'error_correction':
+            inputs = [
+                'error_correction', query.get('original_plan', {}),
+                query.get('error_message', ''), query.get('error_traceback', '')
+            ]
+        else:
+            recent = list(islice(reversed(query.get('conversation_history') or []), HISTORY_MESSAGES_IN_PROMPT))
+            inputs = [
+                'plan', query.get('user_request', ''),
+                [(msg.get('message_type'), msg.get('content', '')) for msg in recent],
+                query.get('current_model_state')
+            ]
+        # O uso do cache de contexto muda as seções de documentação/schema
+        inputs.append(self._has_context_cache())
         
+        serialized = safe_json_dumps(inputs, sort_keys=True)
+        return hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).digest()
+    
+    def _render_prompt(self, query: Dict[str, Any]) -> str:
+        """Monta o texto do prompt a partir dos templates"""
         if query.get('request_type') == 'error_correction':
             prompt = self._build_error_correction_prompt(query)
             return prompt
 
-        prompt_body = textwrap.dedent(f"""
-            # ROLE: Expert CAD Design Assistant with CadQuery
-
-            ## User Request
-            {query.get('user_request', '')}
-
-            ## Conversation History
-            {self._format_conversation_history(query.get('conversation_history', []))}
-
-            ## Current Model State
-            {safe_json_dumps(query.get('current_model_state'), indent=2) if query.get('current_model_state') else 'No active model'}
-
-            ## Available CadQuery Operations
-            {self.cadquery_api_docs}
-
-            # THINKING PROCESS (Chain-of-Thought):
-            Before generating the JSON response, think through these steps:
-            1. **Analyze Request**: What does the user want to create or modify?
-            2. **Identify Type**: Is this creation, modification, query, or error handling?
-            3. **Plan Operations**: What CadQuery operations are needed?
-            4. **Parameter Setup**: What parameters should be configurable?
-            5. **Validation**: Does this plan make geometric sense?
-
-            # FEW-SHOT EXAMPLES:
-
-            ## Example 1 - Simple Cylinder with Direct CadQuery Code:
-            User Request: "Create a cylinder with radius 10 and height 20"
-            
-            Correct JSON Response:
-            {{
-                "intention_type": "creation",
-                "response_text": "I'll create a cylinder with the specified dimensions using parametric CadQuery code.",
-                "execution_plan": {{
-                    "id": "cylinder_creation_001",
-                    "description": "Create parametric cylinder",
-                    "cadquery_code": "result = cq.Workplane('XY').cylinder(cylinder_height, cylinder_radius)",
-                    "parameters": {{
-                        "cylinder_height": 20.0,
-                        "cylinder_radius": 10.0
-                    }},
-                    "ast_nodes": [],
-                    "new_parameters": {{
-                        "cylinder_height": 20.0,
-                        "cylinder_radius": 10.0
-                    }},
-                    "affected_operations": []
-                }},
-                "parameter_updates": {{}},
-                "requires_clarification": false,
-                "clarification_questions": [],
-                "confidence": 0.95
-            }}
-
-            ## Example 2 - Screw with Safe Fillet:
-            User Request: "Create a screw with curved head using fillet"
-            
-            Correct JSON Response:
-            {{
-                "intention_type": "creation",
-                "response_text": "I'll create a screw with a curved head using safe fillet techniques.",
-                "execution_plan": {{
-                    "id": "safe_fillet_screw",
-                    "description": "Create screw with safe fillet on head",
-                    "cadquery_code": "# Create screw body\\nscrew_body = cq.Workplane('XY').cylinder(body_length, body_diameter/2)\\n\\n# Create screw head\\nscrew_head = cq.Workplane('XY').cylinder(head_height, head_diameter/2)\\n\\n# Calculate safe fillet radius\\nsafe_fillet_radius = min(fillet_radius, head_height/2, (head_diameter - body_diameter)/4)\\n\\n# Apply safe fillet to head edges\\nscrew_head = screw_head.edges().fillet(safe_fillet_radius)\\n\\n# Position head on body\\nscrew_head = screw_head.translate((0, 0, body_length))\\n\\n# Combine parts\\nresult = screw_body.union(screw_head)",
-                    "parameters": {{
-                        "body_diameter": 6.0,
-                        "body_length": 20.0,
-                        "head_diameter": 10.0,
-                        "head_height": 4.0,
-                        "fillet_radius": 2.0
-                    }},
-                    "ast_nodes": [],
-                    "new_parameters": {{
-                        "body_diameter": 6.0,
-                        "body_length": 20.0,
-                        "head_diameter": 10.0,
-                        "head_height": 4.0,
-                        "fillet_radius": 2.0
-                    }},
-                    "affected_operations": []
-                }},
-                "parameter_updates": {{}},
-                "requires_clarification": false,
-                "clarification_questions": [],
-                "confidence": 0.95
-            }}
-
-            ## Example 3 - Bearing with Advanced CadQuery Operations:
-            User Request: "Create a ball bearing 6200 with outer ring, inner ring, and balls"
-            
-            Correct JSON Response:
-            {{
-                "intention_type": "creation",
-                "response_text": "I'll create a complete ball bearing 6200 with all components.",
-                "execution_plan": {{
-                    "id": "bearing_6200_complete",
-                    "description": "Create ball bearing with outer ring, inner ring, and balls",
-                    "cadquery_code": "import math\\n\\n# Outer ring\\nouter_ring = (cq.Workplane('XY')\\n              .cylinder(bearing_width, bearing_od/2)\\n              .cylinder(bearing_width, (bearing_od - ball_diameter)/2, combine=False))\\n\\n# Inner ring\\ninner_ring = (cq.Workplane('XY')\\n              .cylinder(bearing_width, (bearing_id + ball_diameter)/2)\\n              .cylinder(bearing_width, bearing_id/2, combine=False))\\n\\n# Ball pitch circle\\npitch_radius = (bearing_od - bearing_id - ball_diameter) / 2 + bearing_id/2\\n\\n# Create single ball\\nball = cq.Workplane('XY').sphere(ball_diameter/2)\\n\\n# Create array of balls\\nballs = (cq.Workplane('XY')\\n         .center(pitch_radius, 0)\\n         .sphere(ball_diameter/2)\\n         .polarArray(radius=0, startAngle=0, angle=360, count=num_balls))\\n\\n# Combine all components\\nresult = outer_ring.union(inner_ring).union(balls)",
-                    "parameters": {{
-                        "bearing_od": 30.0,
-                        "bearing_id": 10.0,
-                        "bearing_width": 9.0,
-                        "ball_diameter": 4.0,
-                        "num_balls": 8
-                    }},
-                    "ast_nodes": [],
-                    "new_parameters": {{
-                        "bearing_od": 30.0,
-                        "bearing_id": 10.0,
-                        "bearing_width": 9.0,
-                        "ball_diameter": 4.0,
-                        "num_balls": 8
-                    }},
-                    "affected_operations": []
-                }},
-                "parameter_updates": {{}},
-                "requires_clarification": false,
-                "clarification_questions": [],
-                "confidence": 0.85
-            }}
-
-            ## Example 4 - Cilindro com Furo Contextual (TÉCNICA CORRETA):
-            User Request: "Create a cylinder with a hole through it"
-            
-            Correct JSON Response:
-            {{
-                "intention_type": "creation",
-                "response_text": "I'll create a cylinder with a contextual hole using proper face selection to ensure correct positioning.",
-                "execution_plan": {{
-                    "id": "contextual_hole_cylinder",
-                    "description": "Create cylinder with contextual hole using face selection",
-                    "cadquery_code": "# Create cylinder with base on XY plane (not centered)\\nbase_cylinder = cq.Workplane('XY').cylinder(cylinder_height, cylinder_radius, centered=False)\\n\\n# Select top face and create contextual hole\\nresult = base_cylinder.faces('>Z').hole(hole_diameter)",
-                    "parameters": {{
-                        "cylinder_height": 40.0,
-                        "cylinder_radius": 20.0,
-                        "hole_diameter": 8.0
-                    }},
-                    "ast_nodes": [],
-                    "new_parameters": {{
-                        "cylinder_height": 40.0,
-                        "cylinder_radius": 20.0,
-                        "hole_diameter": 8.0
-                    }},
-                    "affected_operations": []
-                }},
-                "parameter_updates": {{}},
-                "requires_clarification": false,
-                "clarification_questions": [],
-                "confidence": 0.95
-            }}
-
-            # JSON SCHEMA TO FOLLOW:
-            {json.dumps(json_schema, indent=2)}
-
-            # CRITICAL INSTRUCTIONS:
-            1. **Output Format**: Return ONLY valid JSON - no markdown, no code blocks, no extra text
-            2. **CadQuery Code**: Use the "cadquery_code" field for direct CadQuery Python code
-            3. **Parameter Names**: Always use descriptive variable names, never hardcoded values
-            4. **Code Freedom**: You have TOTAL FREEDOM to use any CadQuery operations from the API documentation
-            5. **Complex Geometries**: Feel free to create sophisticated mechanical components with multiple operations
-            6. **Code Structure**: Use \\n for line breaks in cadquery_code, create intermediate variables as needed
-            7. **Final Result**: Always assign the final geometry to a variable named 'result'
-            8. **Imports**: Include necessary imports like 'import math' if needed within the cadquery_code
-            9. **Real Engineering**: Create actual engineering components, not simplified primitives
-            10. **FILETES SEGUROS**: SEMPRE use .edges() sem seletores específicos para filetes, e calcule raio máximo seguro
-            11. **EVITAR SELETORES**: NUNCA use "|X", "|Y", "|Z" para arestas - use .edges() ou .faces().edges()
-            
-            # PROBLEMA CRÍTICO: AMBIGUIDADE DO "MODELO MENTAL" vs. LÓGICA DO CÓDIGO
-            12. **FUROS CONTEXTUAIS**: Ao gerar código CadQuery para adicionar furos ou recortes, SEMPRE que possível, selecione primeiro a face de referência (ex: .faces('>Z')) antes de aplicar a operação (.hole(), .cut(), etc.). Isso garante que a operação seja aplicada corretamente em relação à geometria existente.
-            
-            **Exemplo CORRETO para furos:**
-            ```
-            # 1. Criar cilindro com base no plano (não centralizado)
-            base_cylinder = cq.Workplane("XY").cylinder(height, radius, centered=False)
-            
-            # 2. Selecionar face superior e fazer furo contextual
-            result = base_cylinder.faces(">Z").hole(hole_diameter)
-            ```
-            
-            **Exemplo INCORRETO (evitar):**
-            ```
-            # PROBLEMA: Furo "no vácuo" sem contexto da geometria
-            cylinder = cq.Workplane("XY").cylinder(height, radius)
-            hole = cq.Workplane("XY").hole(diameter)  # Posição ambígua!
-            result = cylinder.cut(hole)
-            ```
-            
-            13. **POSICIONAMENTO EXPLÍCITO**: Para geometrias que devem apoiar em uma base (como cilindros com furos), use `centered=False` para posicionar a base no plano XY, eliminando ambiguidade de coordenadas.
-            
-            14. **OPERAÇÕES RELACIONAIS**: Sempre que uma operação depende de outra geometria existente (furos, chanfros, filetes), use seletores de face/aresta (.faces(">Z"), .edges()) para estabelecer contexto geométrico claro.
-
-            Provide a response in JSON only.
-        """).strip()
-
-        return prompt_body
+        return self._static_prompt_prefix(_PROMPT_STATIC_TEMPLATE) + "\n\n" + _PROMPT_DYNAMIC_TEMPLATE.format(
+            user_request=query.get('user_request', ''),
+            conversation_history=self._format_conversation_history(query.get('conversation_history', [])),
+            model_state=_format_model_state(query.get('current_model_state'))
+        )
+    
+    def _static_prompt_prefix(self, template: str) -> str:
+        """Prefixo estático do prompt, formatado uma vez para cada variante (com/sem cache de contexto)"""
+        key = (template, self._has_context_cache())
+        prefix = self._static_prompt_prefixes.get(key)
+        if prefix is None:
+            prefix = template.format(
+                api_docs=self._api_docs_section(),
+                json_schema=self._json_schema_section()
+            )
+            self._static_prompt_prefixes[key] = prefix
+        return prefix
     
     def _build_error_correction_prompt(self, query: Dict[str, Any]) -> str:
         """Constrói prompt específico para correção de erros usando Chain-of-Thought"""
-        return textwrap.dedent(f"""
-            # ROLE: Expert CAD Error Diagnostician & Plan Corrector
-            You are a specialized assistant for debugging and correcting CAD execution plans in CadQuery.
-            Your expertise includes analyzing error messages and generating corrected execution plans.
-
-            # ERROR ANALYSIS CONTEXT:
-            ## Original Plan That Failed:
-            {safe_json_dumps(query.get('original_plan', {}), indent=2)}
-
-            ## Error Message:
-            {query.get('error_message', '')}
-
-            ## Stack Trace:
-            {query.get('error_traceback', '')}
-
-            ## Available CadQuery API:
-            {self.cadquery_api_docs}
-
-            # THINKING PROCESS (Chain-of-Thought):
-            Before generating the corrected JSON response, think through these steps:
-            1. **Error Analysis**: What specific error occurred and why?
-            2. **Root Cause**: What in the original plan caused this error?
-            3. **API Validation**: Are we using CadQuery operations correctly?
-            4. **Parameter Check**: Are all required parameters present and valid?
-            5. **Logic Review**: Does the geometric operation sequence make sense?
-            6. **Correction Strategy**: What specific changes are needed?
-
-            # COMMON ERROR PATTERNS & FIXES:
-
-            ## Pattern 1 - Fillet Edge Selection Errors:
-            Error: "Fillets requires that edges be selected"
-            Fix: Use .edges() without specific selectors, calculate safe radius
-            Example: "geometry.edges().fillet(safe_radius)"
-
-            ## Pattern 2 - Missing Parameters:
-            Error: "missing 1 required positional argument"
-            Fix: Add missing parameters to the operation
-
-            ## Pattern 3 - Incorrect API Usage:
-            Error: "centerOfMass() missing argument"
-            Fix: Use correct API method like solid.centerOfMass() or CenterOfBoundBox()
-
-            ## Pattern 4 - Invalid Object References:
-            Error: "object has no attribute"
-            Fix: Ensure target objects exist before operations
-
-            ## Pattern 5 - Syntax Errors:
-            Error: "expected 'except' or 'finally' block"
-            Fix: Check code structure and indentation
-            
-            ## CRITICAL FILLET SAFETY RULES:
-            - NEVER use "|X", "|Y", "|Z" selectors for edges
-            - ALWAYS calculate safe_radius = min(desired_radius, dimension_constraints)
-            - USE .edges() without selectors for reliable fillet application
-
-            # CORRECTION INSTRUCTIONS:
-            1. **Output Format**: Return ONLY valid JSON - no markdown, no code blocks, no extra text
-            2. **Preserve Intent**: Keep the original geometric intention intact
-            3. **Fix Specific Error**: Address the exact error identified
-            4. **Validate Logic**: Ensure the corrected plan makes geometric sense
-            5. **Parameter Safety**: Use only valid CadQuery parameters
-
-            # YOUR TASK:
-            Analyze the error systematically using the thinking process above, then generate a corrected JSON execution plan that resolves the specific error while maintaining the original design intent.
-            
-            Return ONLY the corrected JSON response, no additional text.
-        """).strip()
+        error_message = query.get('error_message', '')
+        error_traceback = query.get('error_traceback', '')
+        return self._static_prompt_prefix(_ERROR_CORRECTION_STATIC_TEMPLATE) + "\n\n" + _ERROR_CORRECTION_DYNAMIC_TEMPLATE.format(
+            original_plan=safe_json_dumps(query.get('original_plan', {}), indent=2),
+            error_message=error_message,
+            error_traceback=error_traceback,
+            error_patterns=_match_error_patterns(f"{error_message}\n{error_traceback}")
+        )
     
     def _format_conversation_history(self, history: List[Dict]) -> str:
         """Formata histórico da conversa para o prompt"""
         if not history:
             return "Nenhuma conversa anterior."
         
-        formatted = []
-        for msg in history[-5:]:  # Últimas 5 mensagens
-            role = "Usuário" if msg.get('message_type') == 'user_input' else "Sistema"
-            content = msg.get('content', '')
-            formatted.append(f"{role}: {content}")
+        # Últimas mensagens, da mais recente para a mais antiga, até esgotar o orçamento
+        # de caracteres (sem copiar o histórico inteiro; funciona também com deque)
+        lines = []
+        budget = HISTORY_PROMPT_MAX_CHARS
+        for msg in islice(reversed(history), HISTORY_MESSAGES_IN_PROMPT):
+            line = f"{_HISTORY_ROLE_LABELS.get(msg.get('message_type'), 'Sistema')}: {msg.get('content', '')}"
+            if len(line) > budget:
+                # A mensagem mais recente sempre entra, truncada se necessário
+                if not lines:
+                    lines.append(line[:budget] + "...")
+                break
+            lines.append(line)
+            budget -= len(line) + 1
+        return "\n".join(reversed(lines))
+    
+    def _response_cache_key(self, prompt: str) -> str:
+        """Chave do cache de respostas: provider, modelo e prompt"""
+        return hashlib.sha256(f"{self.llm_provider}|{self.current_model_name}|{prompt}".encode('utf-8')).hexdigest()
+    
+    def _get_cached_response(self, prompt: str) -> Optional[str]:
+        """Retorna resposta em cache para o prompt, se existir e não tiver expirado"""
+        key = self._response_cache_key(prompt)
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, response_text = entry
+        if datetime.now() >= expires_at:
+            del self._response_cache[key]
+            return None
         
-        return "\n".join(formatted)
+        self._response_cache.move_to_end(key)
+        return response_text
     
-    async def _call_llm(self, prompt: str, context: str = "plan_generation") -> str:
-        """Faz chamada assíncrona para o LLM"""
+    def _store_cached_response(self, prompt: str, response_text: str):
+        """Guarda resposta parseada com sucesso no cache de respostas"""
+        key = self._response_cache_key(prompt)
+        self._response_cache[key] = (datetime.now() + LLM_RESPONSE_CACHE_TTL, response_text)
+        self._response_cache.move_to_end(key)
+        if len(self._response_cache) > LLM_RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+    
+    async def _call_llm(self, prompt: str, context: str = "plan_generation", use_cache: bool = True) -> str:
+        """Faz chamada assíncrona para o LLM, consultando antes o cache de respostas"""
+        if use_cache:
+            cached = self._get_cached_response(prompt)
+            if cached is not None:
+                logger.info(f"Resposta do {self.llm_provider.upper()} obtida do cache (contexto: {context}, cache_hit=True)")
+                return cached
+        
         try:
             logger.info(f"Enviando prompt para {self.llm_provider.upper()} (contexto: {context})")
             
-            if self.llm_provider == "ollama":
-                response_text = await self._call_ollama(prompt)
-            else:
-                response_text = await self._call_gemini(prompt)
+            async with self._llm_semaphore:
+                if self.llm_provider == "ollama":
+                    response_text = await self._call_ollama(prompt)
+                else:
+                    response_text = await self._call_gemini(prompt)
             
             logger.info(f"Resposta recebida do {self.llm_provider.upper()}: {len(response_text)} caracteres")
             
@@ -826,6 +1574,22 @@ class PlanningModule:
             logger.error(f"Erro na chamada do {self.llm_provider.upper()}: {e}")
             raise
     
+    def _preload_ollama_model(self):
+        """Carrega o modelo no Ollama em segundo plano para a primeira geração não pagar o cold start"""
+        model_name = self.current_model_name
+        url = f"{self.ollama_base_url}/api/generate"
+        timeout = self.ollama_timeout
+        
+        def preload():
+            try:
+                # Requisição sem prompt apenas carrega os pesos e aplica o keep_alive
+                _ollama_session().post(url, json={"model": model_name, "keep_alive": OLLAMA_KEEP_ALIVE}, timeout=timeout)
+                logger.info(f"🔥 OLLAMA - Model '{model_name}' preloaded (keep_alive={OLLAMA_KEEP_ALIVE})")
+            except Exception as e:
+                logger.warning(f"⚠️  OLLAMA - Could not preload model '{model_name}': {e}")
+        
+        threading.Thread(target=preload, name="ollama-preload", daemon=True).start()
+    
     async def _call_ollama(self, prompt: str) -> str:
         """Faz chamada assíncrona para o Ollama com streaming para debug"""
         try:
@@ -837,9 +1601,10 @@ class PlanningModule:
                 "model": self.current_model_name,
                 "prompt": prompt,
                 "stream": True,  # Habilitar streaming para debug
+                "keep_alive": OLLAMA_KEEP_ALIVE,
                 "options": {
                     "temperature": 0.1,
-                    "num_predict": 15000,
+                    "num_predict": LLM_MAX_OUTPUT_TOKENS,
                     "top_p": 0.9,
                     "top_k": 40
                 }
@@ -849,15 +1614,14 @@ class PlanningModule:
             logger.info(f"🤖 OLLAMA - Model: {self.current_model_name}")
             
             # Fazer requisição assíncrona com streaming
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             
             def make_streaming_request():
                 """Função para fazer requisição com streaming"""
-                import time
                 start_time = time.time()
                 
                 try:
-                    response = requests.post(
+                    response = _ollama_session().post(
                         f"{self.ollama_base_url}/api/generate",
                         json=payload,
                         timeout=self.ollama_timeout,
@@ -870,27 +1634,28 @@ class PlanningModule:
                     
                     logger.info(f"✅ OLLAMA - Connection established, starting to receive data...")
                     
-                    # Processar resposta em streaming
-                    full_response = ""
+                    # Processar resposta em streaming (partes acumuladas em lista e unidas uma vez)
+                    scanner = _StreamingJsonScanner()
+                    received_chars = 0
+                    full_response = None
                     chunk_count = 0
                     last_log_time = time.time()
                     
-                    for line in response.iter_lines():
+                    for line in response.iter_lines(chunk_size=OLLAMA_STREAM_CHUNK_SIZE):
                         if line:
                             chunk_count += 1
-                            current_time = time.time()
-
-                            print("current line received: ", line)
                             
-                            # Log progresso a cada 5 segundos
-                            if current_time - last_log_time > 5:
-                                elapsed = current_time - start_time
-                                logger.info(f"⏳ OLLAMA - Receiving data... {chunk_count} chunks, {elapsed:.1f}s elapsed")
-                                logger.info(f"📊 OLLAMA - Response so far: {len(full_response)} chars")
-                                last_log_time = current_time
+                            # Log progresso a cada 5 segundos (relógio lido só a cada N chunks)
+                            if chunk_count % OLLAMA_PROGRESS_CHECK_EVERY == 0:
+                                current_time = time.time()
+                                if current_time - last_log_time > OLLAMA_PROGRESS_LOG_INTERVAL:
+                                    elapsed = current_time - start_time
+                                    logger.info(f"⏳ OLLAMA - Receiving data... {chunk_count} chunks, {elapsed:.1f}s elapsed")
+                                    logger.info(f"📊 OLLAMA - Response so far: {received_chars} chars")
+                                    last_log_time = current_time
                             
                             try:
-                                chunk_data = json.loads(line.decode('utf-8'))
+                                chunk_data = _json_loads(line)
                                 
                                 # Verificar se há erro no chunk
                                 if 'error' in chunk_data:
@@ -900,24 +1665,35 @@ class PlanningModule:
                                 # Adicionar resposta parcial
                                 if 'response' in chunk_data:
                                     partial_response = chunk_data['response']
-                                    full_response += partial_response
+                                    received_chars += len(partial_response)
                                     
                                     # Log primeira resposta
                                     if chunk_count == 1:
                                         logger.info(f"🎉 OLLAMA - First response chunk received: '{partial_response[:50]}...'")
+                                    
+                                    # Encerrar assim que um objeto JSON completo for recebido
+                                    completed = scanner.feed(partial_response)
+                                    if completed is not None:
+                                        full_response = completed
+                                        response.close()
+                                        logger.info(f"✅ OLLAMA - Complete JSON received after {time.time() - start_time:.1f}s, closing stream")
+                                        break
                                 
                                 # Verificar se terminou
                                 if chunk_data.get('done', False):
                                     total_time = time.time() - start_time
                                     logger.info(f"✅ OLLAMA - Stream completed in {total_time:.1f}s")
                                     logger.info(f"📈 OLLAMA - Total chunks: {chunk_count}")
-                                    logger.info(f"📝 OLLAMA - Final response length: {len(full_response)} chars")
+                                    logger.info(f"📝 OLLAMA - Final response length: {received_chars} chars")
                                     break
                                     
                             except json.JSONDecodeError as e:
                                 logger.warning(f"⚠️  OLLAMA - Invalid JSON chunk: {line[:100]}...")
                                 continue
                     
+                    if full_response is None:
+                        full_response = scanner.text()
+                    
                     if not full_response:
                         logger.error("❌ OLLAMA - No response received from stream")
                         raise ValueError("Ollama retornou resposta vazia")
@@ -938,7 +1714,7 @@ class PlanningModule:
                     raise
             
             # Executar requisição em thread separada
-            response_text = await loop.run_in_executor(None, make_streaming_request)
+            response_text = await loop.run_in_executor(self._llm_executor, make_streaming_request)
             
             logger.info(f"✅ OLLAMA - Request completed successfully")
             return response_text
@@ -954,32 +1730,50 @@ class PlanningModule:
             logger.error(f"💥 OLLAMA - Unexpected error: {e}")
             raise ValueError(f"Erro na chamada Ollama: {e}")
     
-    async def _call_gemini(self, prompt: str) -> str:
-        """Faz chamada assíncrona para o Gemini"""
+    async def _call_gemini(self, prompt: str, model=None) -> str:
+        """Faz chamada assíncrona para o Gemini (modelo atual se nenhum for informado)"""
+        model_name = self.current_model_name
         try:
-            # Gemini não é nativamente async, então executamos em thread
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, self.model.generate_content, prompt
-            )
+            model = model or await self._get_model(model_name)
             
-            return response.text
+            # Gemini não é nativamente async, então consumimos o stream em thread
+            try:
+                return await self._run_blocking(self._consume_gemini_stream, model, prompt)
+            except google_exceptions.NotFound:
+                if model_name not in self._context_caches:
+                    raise
+                # Cache de contexto expirado/removido: recriar o modelo e tentar uma única vez
+                logger.warning("⚠️  GEMINI - Context cache not found, recreating model and retrying")
+                await self._drop_model(model_name)
+                model = await self._get_model(model_name)
+                if model_name not in self._context_caches:
+                    # Sem cache recriado o prompt (montado sem documentação) ficaria incompleto
+                    raise
+                return await self._run_blocking(self._consume_gemini_stream, model, prompt)
             
         except Exception as e:
             raise ValueError(f"Erro na chamada Gemini: {e}")
     
+    @staticmethod
+    def _consume_gemini_stream(model, prompt: str) -> str:
+        """
+        Consome a resposta do Gemini em streaming, encerrando assim que um objeto
+        JSON completo for decodificado. Sem JSON completo, retorna o texto integral.
+        """
+        scanner = _StreamingJsonScanner()
+        for chunk in model.generate_content(prompt, stream=True):
+            completed = scanner.feed(chunk.text)
+            if completed is not None:
+                logger.debug("GEMINI - JSON completo recebido, encerrando stream")
+                return completed
+        
+        return scanner.text()
+    
     def _parse_llm_response(self, response_text: str) -> LLMResponse:
         """Parseia resposta JSON estruturada do LLM com validação robusta"""
         try:
-            # Limpar resposta de possíveis artefatos
-            cleaned_response = self._clean_json_response(response_text)
-            
-            # Validar se é JSON válido
-            try:
-                data = json.loads(cleaned_response)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON inválido recebido do Gemini: {e}")
-                logger.error(f"Resposta limpa: {cleaned_response[:5000]}...")
-                return self._create_error_response("Resposta do Gemini não é JSON válido")
+            # Limpar resposta de possíveis artefatos (já decodificada na mesma passada)
+            _, data = self._clean_json_response(response_text)
             
             # Validar estrutura mínima
             if not isinstance(data, dict):
@@ -1002,15 +1796,16 @@ class PlanningModule:
                     logger.error(f"Erro ao construir execution_plan: {e}")
                     # Continuar sem execution_plan ao invés de falhar
             
-            # Construir LLMResponse com validação de tipos
+            # Construir LLMResponse com validação de tipos (dicts/listas do parse são usados sem cópia)
+            confidence = data.get('confidence')
             response = LLMResponse(
                 intention_type=str(data.get('intention_type', 'unknown')),
                 execution_plan=execution_plan,
-                parameter_updates=dict(data.get('parameter_updates', {})),
+                parameter_updates=data.get('parameter_updates') or {},
                 response_text=str(data.get('response_text', '')),
-                confidence=float(data.get('confidence', 0.5)) if data.get('confidence') is not None else None,
+                confidence=float(confidence) if confidence is not None else None,
                 requires_clarification=bool(data.get('requires_clarification', False)),
-                clarification_questions=list(data.get('clarification_questions', []))
+                clarification_questions=data.get('clarification_questions') or []
             )
 
             logger.info(f"Resposta do {self.llm_provider.upper()} parseada com sucesso: {response.intention_type}")
@@ -1021,115 +1816,58 @@ class PlanningModule:
             logger.error(f"Resposta original: {response_text[:5000]}...")
             return self._create_error_response(f"Erro interno: {str(e)}")
     
-    def _clean_json_response(self, response_text: str) -> str:
+    def _clean_json_response(self, response_text: str) -> Tuple[str, Any]:
         """
         Extrai JSON da resposta do LLM usando múltiplas estratégias robustas.
         Baseado em melhores práticas de engenharia de prompt para parsing de structured output.
+        
+        Returns:
+            Tupla (texto JSON extraído, objeto decodificado), evitando um segundo parse
         """
         if not response_text:
-            return "{}"
+            return "{}", {}
         
         logger.debug(f"Limpando resposta (tamanho: {len(response_text)})")
         
-        # Estratégia 1: Remover markdown code blocks
+        # Caminho rápido: resposta já é JSON válido (caso comum com response_mime_type JSON)
         cleaned = response_text.strip()
+        if _quick_structural_ok(cleaned):
+            try:
+                return cleaned, _json_loads(cleaned)
+            except json.JSONDecodeError:
+                pass
         
-        # Remover ```json ou ``` no início
-        cleaned = re.sub(r'^```(?:json|JSON)?\s*\n?', '', cleaned, flags=re.MULTILINE)
-        # Remover ``` no final
-        cleaned = re.sub(r'\n?\s*```\s*$', '', cleaned, flags=re.MULTILINE)
-        
-        # Estratégia 2: Extrair JSON usando regex mais robusta
-        # Procurar por estruturas JSON válidas (balanceadas)
-        json_patterns = [
-            # Padrão 1: JSON completo do início ao fim da string
-            r'^\s*(\{.*\})\s*$',
-            # Padrão 2: JSON em qualquer lugar da string
-            r'(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})',
-            # Padrão 3: JSON multi-linha com indentação
-            r'(\{(?:[^{}]|(?:\{[^{}]*\}))*\})'
-        ]
-        
-        for pattern in json_patterns:
-            matches = re.findall(pattern, cleaned, re.DOTALL | re.MULTILINE)
-            if matches:
-                # Pegar o match mais longo (mais provável de ser o JSON completo)
-                potential_json = max(matches, key=len) if isinstance(matches[0], str) else matches[0]
-                
-                # Validar se é JSON válido
+        # Estratégia 1: objeto JSON dentro de um markdown code block (uma única busca)
+        if '```' in cleaned:
+            match = _RE_FENCED_JSON.search(cleaned)
+            if match:
+                candidate = match.group(1)
                 try:
-                    json.loads(potential_json)
-                    logger.debug("JSON válido encontrado usando regex")
-                    return potential_json.strip()
+                    data = _json_loads(candidate)
+                    logger.debug("JSON válido encontrado dentro de code block")
+                    return candidate, data
                 except json.JSONDecodeError:
-                    continue
+                    pass
         
-        # Estratégia 3: Tentar balancear chaves manualmente
-        try:
-            json_candidate = self._extract_balanced_json(cleaned)
-            if json_candidate:
-                json.loads(json_candidate)  # Validar
-                logger.debug("JSON válido encontrado por balanceamento de chaves")
-                return json_candidate
-        except json.JSONDecodeError:
-            pass
-        
-        # Estratégia 4: Tentar extrair linha por linha
-        lines = cleaned.split('\n')
-        for i, line in enumerate(lines):
-            if line.strip().startswith('{'):
-                # Tentar construir JSON a partir desta linha
-                remaining_lines = '\n'.join(lines[i:])
-                try:
-                    json_candidate = self._extract_balanced_json(remaining_lines)
-                    if json_candidate:
-                        json.loads(json_candidate)
-                        logger.debug("JSON válido encontrado linha por linha")
-                        return json_candidate
-                except json.JSONDecodeError:
-                    continue
+        # Estratégia 2: decodificar o primeiro objeto JSON válido a partir de cada '{'
+        found = _raw_decode_first(cleaned)
+        if found is not None:
+            logger.debug("JSON válido encontrado por raw_decode")
+            return found
         
-        # Estratégia 5: Se tudo falhar, tentar usar o texto original limpo
-        if cleaned.strip().startswith('{') and cleaned.strip().endswith('}'):
-            try:
-                json.loads(cleaned)
-                logger.debug("Usando texto original como JSON")
-                return cleaned
-            except json.JSONDecodeError:
-                pass
+        # Estratégia 3: remover vírgulas finais antes de '}' / ']' e tentar novamente
+        repaired = _RE_TRAILING_COMMA.sub(r'\1', cleaned)
+        if repaired != cleaned:
+            found = _raw_decode_first(repaired)
+            if found is not None:
+                logger.debug("JSON válido encontrado após remover vírgulas finais")
+                return found
         
         logger.warning("Não foi possível extrair JSON válido da resposta")
         logger.debug(f"Texto original: {response_text[:5000]}...")
         
         # Retornar JSON de erro como fallback
-        return json.dumps({
-            "intention_type": "error",
-            "response_text": "Erro: Não foi possível extrair JSON válido da resposta do LLM",
-            "requires_clarification": True,
-            "clarification_questions": ["Por favor, reformule sua solicitação de forma mais específica."]
-        })
-    
-    def _extract_balanced_json(self, text: str) -> str:
-        """Extrai JSON balanceado (chaves abertas = chaves fechadas) do texto"""
-        text = text.strip()
-        if not text.startswith('{'):
-            return ""
-        
-        brace_count = 0
-        start_found = False
-        
-        for i, char in enumerate(text):
-            if char == '{':
-                brace_count += 1
-                start_found = True
-            elif char == '}':
-                brace_count -= 1
-                
-                # Se chegamos a 0 e já começamos, encontramos o JSON completo
-                if start_found and brace_count == 0:
-                    return text[:i+1]
-        
-        return ""
+        return _JSON_EXTRACTION_ERROR, _JSON_EXTRACTION_ERROR_DATA
     
     def _build_execution_plan(self, plan_data: Dict[str, Any]) -> ExecutionPlan:
         """Constrói ExecutionPlan com validação robusta"""
@@ -1138,19 +1876,19 @@ class PlanningModule:
         for node_data in plan_data.get('ast_nodes', []):
             try:
                 # Validar campos obrigatórios do nó
-                required_node_fields = ["id", "node_type", "operation", "parameters"]
-                for field in required_node_fields:
+                for field in _REQUIRED_NODE_FIELDS:
                     if field not in node_data:
                         raise ValueError(f"Campo obrigatório '{field}' ausente no nó AST")
                 
-                # Construir nó AST
+                # Construir nó AST (o pydantic valida e copia os containers; sem cópias extras aqui)
                 ast_node = ASTNode(
                     id=str(node_data['id']),
-                    node_type=ASTNodeType(node_data['node_type']),
-                    operation=str(node_data['operation']),
-                    parameters=dict(node_data['parameters']),
-                    children=list(node_data.get('children', [])),
-                    metadata=dict(node_data.get('metadata', {}))
+                    node_type=node_data['node_type'],
+                    # Nomes de operação formam um vocabulário pequeno: internar reduz comparações a identidade
+                    operation=sys.intern(str(node_data['operation'])),
+                    parameters=node_data['parameters'],
+                    children=node_data.get('children') or [],
+                    metadata=node_data.get('metadata') or {}
                 )
                 ast_nodes.append(ast_node)
                 
@@ -1164,8 +1902,8 @@ class PlanningModule:
             id=str(plan_data.get('id', '')),
             description=str(plan_data.get('description', '')),
             ast_nodes=ast_nodes,
-            new_parameters=dict(plan_data.get('new_parameters', {})),
-            affected_operations=list(plan_data.get('affected_operations', [])),
+            new_parameters=plan_data.get('new_parameters', {}),
+            affected_operations=plan_data.get('affected_operations', []),
             # Incluir novos campos para código CadQuery direto
             cadquery_code=plan_data.get('cadquery_code'),
             parameters=plan_data.get('parameters')
@@ -1180,78 +1918,82 @@ class PlanningModule:
         )
     
     def _validate_execution_plan(self, plan: ExecutionPlan) -> ValidationResult:
-        """Valida plano de execução antes da execução"""
-        errors = []
-        warnings = []
+        """Valida plano de execução antes da execução (com cache pelo conteúdo dos nós)"""
+        # A validação depende apenas de id, tipo, operação e nomes de parâmetros de cada nó
+        key = tuple(
+            (node.id, node.node_type, node.operation, frozenset(node.parameters))
+            for node in plan.ast_nodes
+        )
+        cached = self._validation_cache.get(key)
+        if cached is not None:
+            self._validation_cache.move_to_end(key)
+            return cached
         
+        result = self._run_plan_validation(plan)
+        self._validation_cache[key] = result
+        if len(self._validation_cache) > VALIDATION_CACHE_SIZE:
+            self._validation_cache.popitem(last=False)
+        return result
+    
+    def _is_valid_plan(self, plan: ExecutionPlan) -> bool:
+        """Indica se o plano passa na validação, parando no primeiro erro encontrado"""
+        return next(self._iter_plan_errors(plan), None) is None
+    
+    def _run_plan_validation(self, plan: ExecutionPlan) -> ValidationResult:
+        """Executa as regras de validação do plano"""
+        errors = [
+            {"node_id": node_id, "error_type": error_type, "message": message}
+            for node_id, error_type, message in self._iter_plan_errors(plan)
+        ]
+        
+        return ValidationResult(
+            is_valid=len(errors) == 0,
+            errors=errors,
+            warnings=[]
+        )
+    
+    @staticmethod
+    def _iter_plan_errors(plan: ExecutionPlan):
+        """Gera os erros de validação do plano como tuplas (node_id, error_type, message)"""
         for node in plan.ast_nodes:
             # Validar tipo de nó
-            if node.node_type not in [e.value for e in ASTNodeType]:
-                errors.append({
-                    "node_id": node.id,
-                    "error_type": "invalid_node_type",
-                    "message": f"Tipo de nó inválido: {node.node_type}"
-                })
+            if node.node_type not in _AST_NODE_TYPE_VALUES:
+                yield node.id, "invalid_node_type", f"Tipo de nó inválido: {node.node_type}"
             
             # Validar operações
-            if node.node_type == ASTNodeType.OPERATION:
-                if not node.operation:
-                    errors.append({
-                        "node_id": node.id,
-                        "error_type": "missing_operation",
-                        "message": "Nó de operação sem operação especificada"
-                    })
+            if node.node_type == ASTNodeType.OPERATION and not node.operation:
+                yield node.id, "missing_operation", "Nó de operação sem operação especificada"
             
             # Validar parâmetros obrigatórios
-            if node.operation == "cylinder":
-                required_params = ["radius", "height"]
-                for param in required_params:
-                    if param not in node.parameters:
-                        errors.append({
-                            "node_id": node.id,
-                            "error_type": "missing_parameter",
-                            "message": f"Parâmetro obrigatório '{param}' ausente"
-                        })
-        
-        return ValidationResult(
-            is_valid=len(errors) == 0,
-            errors=errors,
-            warnings=warnings
-        )
+            required = _REQUIRED_PARAMS.get(node.operation)
+            if required:
+                for param in sorted(required - node.parameters.keys()):
+                    yield node.id, "missing_parameter", f"Parâmetro obrigatório '{param}' ausente"
     
     async def _auto_correct_plan(
         self, original_query: Dict, failed_response: LLMResponse, validation: ValidationResult
     ) -> LLMResponse:
         """Tenta auto-correção do plano baseado nos erros de validação"""
         
-        correction_query = {
-            **original_query,
-            "request_type": "validation_correction",
-            "original_plan": failed_response.execution_plan.model_dump() if failed_response.execution_plan else None,
-            "validation_errors": [error for error in validation.errors]
-        }
+        # Serialização direta pelo pydantic-core, sem passar por um dict intermediário
+        plan = failed_response.execution_plan
+        original_plan = plan.model_dump_json(indent=2) if plan else "null"
         
-        corrected_prompt = f"""
-            O plano gerado tem erros de validação. Corrija-os:
-
-            ## PLANO ORIGINAL:
-            {safe_json_dumps(correction_query.get('original_plan'), indent=2)}
-
-            ## ERROS DE VALIDAÇÃO:
-            {safe_json_dumps(correction_query.get('validation_errors'), indent=2)}
-
-            Gere um plano corrigido no mesmo formato JSON.
-            """
+        corrected_prompt = _AUTO_CORRECT_PROMPT_TEMPLATE.format(
+            original_plan=original_plan,
+            validation_errors=safe_json_dumps(validation.errors, indent=2)
+        )
         
         try:
-            response = await self._call_llm(corrected_prompt, "auto_correction")
+            # Correções sempre consultam o LLM, sem reaproveitar respostas em cache
+            response = await self._call_llm(corrected_prompt, "auto_correction", use_cache=False)
 
             return self._parse_llm_response(response)
         except Exception as e:
             logger.error(f"Erro na auto-correção: {e}")
             return failed_response  # Retorna original se não conseguir corrigir 
 
-    def _initialize_model(self, model_name: str):
+    async def _initialize_model(self, model_name: str):
         """Inicializa modelo específico (compatibilidade com código existente)"""
         if self.llm_provider == "ollama":
             # Para Ollama, apenas atualizar o nome do modelo
@@ -1259,13 +2001,10 @@ class PlanningModule:
             self.current_model_name = model_name
             logger.info(f"🔄 OLLAMA - Model changed from {old_model} to {model_name}")
         else:
-            # Para Gemini, recriar o modelo
+            # Para Gemini, reutilizar o modelo (e seu cache de contexto) se já criado
             try:
+                await self._get_model(model_name)
                 self.current_model_name = model_name
-                self.model = genai.GenerativeModel(
-                    model_name,
-                    generation_config=self.generation_config
-                )
                 logger.info(f"🔄 GEMINI - Model changed to {model_name}")
             except Exception as e:
                 logger.error(f"❌ GEMINI - Error changing model to {model_name}: {e}")
@@ -1,9 +1,45 @@
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Dict, List, Any, Optional, Union
 from enum import Enum
-import uuid
+import os
+import threading
 from datetime import datetime
 
+# Geração de ids no formato UUID4 a partir de bytes aleatórios obtidos em lote
+# (um os.urandom a cada ID_BATCH_SIZE ids, sem construir objetos uuid.UUID)
+ID_BATCH_SIZE = 128
+_id_buffer = b""
+_id_offset = 0
+_id_lock = threading.Lock()
+
+def _reset_id_buffer():
+    """
+    Descarta o lote herdado após fork, evitando ids repetidos entre processos, e recria
+    o lock (outra thread do pai pode tê-lo deixado adquirido no momento do fork).
+    """
+    global _id_buffer, _id_offset, _id_lock
+    _id_buffer = b""
+    _id_offset = 0
+    _id_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_id_buffer)
+
+def new_id() -> str:
+    """Gera um id aleatório no formato textual de um UUID versão 4"""
+    global _id_buffer, _id_offset
+    with _id_lock:
+        if _id_offset >= len(_id_buffer):
+            _id_buffer = os.urandom(16 * ID_BATCH_SIZE)
+            _id_offset = 0
+        h = _id_buffer[_id_offset:_id_offset + 16].hex()
+        _id_offset += 16
+    # Bits de versão (4) e variante (RFC 4122) como em uuid.uuid4()
+    return f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{'89ab'[int(h[16], 16) & 3]}{h[17:20]}-{h[20:]}"
+
+# Configuração compartilhada pelos modelos: datetime serializado pelo método da própria
+# classe (sem uma lambda por modelo)
+DATETIME_ISO_CONFIG = ConfigDict(json_encoders={datetime: datetime.isoformat})
+
 class MessageType(str, Enum):
     USER_INPUT = "user_input"
     SYSTEM_RESPONSE = "system_response"
@@ -24,18 +60,18 @@ class ExecutionStatus(str, Enum):
     CANCELLED = "cancelled"
 
 class UserMessage(BaseModel):
-    model_config = ConfigDict(json_encoders={datetime: lambda v: v.isoformat()})
+    model_config = DATETIME_ISO_CONFIG
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     content: str
     timestamp: datetime = Field(default_factory=datetime.now)
     selected_geometry: Optional[Dict[str, Any]] = None
     message_type: MessageType = MessageType.USER_INPUT
 
 class SystemResponse(BaseModel):
-    model_config = ConfigDict(json_encoders={datetime: lambda v: v.isoformat()})
+    model_config = DATETIME_ISO_CONFIG
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     content: str
     timestamp: datetime = Field(default_factory=datetime.now)
     execution_plan: Optional[Dict[str, Any]] = None
@@ -43,10 +79,10 @@ class SystemResponse(BaseModel):
     message_type: MessageType = MessageType.SYSTEM_RESPONSE
 
 class ConversationHistory(BaseModel):
-    model_config = ConfigDict(json_encoders={datetime: lambda v: v.isoformat()})
+    model_config = DATETIME_ISO_CONFIG
     
     messages: List[Union[UserMessage, SystemResponse]] = []
-    session_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    session_id: str = Field(default_factory=new_id)
     created_at: datetime = Field(default_factory=datetime.now)
     
     def add_message(self, message: Union[UserMessage, SystemResponse]):
@@ -57,7 +93,7 @@ class ConversationHistory(BaseModel):
 
 class ModelState(BaseModel):
     """Representação serializável do estado atual do modelo 3D"""
-    model_config = ConfigDict(json_encoders={datetime: lambda v: v.isoformat()})
+    model_config = DATETIME_ISO_CONFIG
     
     geometry_data: Optional[Dict[str, Any]] = None
     parameters: Dict[str, Any] = {}
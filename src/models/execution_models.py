@@ -1,8 +1,8 @@
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, field_validator
 from typing import Dict, List, Any, Optional
 from enum import Enum
-import uuid
-from datetime import datetime
+import sys
+from .base_models import new_id, DATETIME_ISO_CONFIG
 
 class ASTNodeType(str, Enum):
     PRIMITIVE = "primitive"
@@ -28,18 +28,24 @@ class OperationType(str, Enum):
 
 class ASTNode(BaseModel):
     """Nó da Árvore de Execução Abstrata"""
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     node_type: ASTNodeType
     operation: Optional[str] = None
     parameters: Dict[str, Any] = Field(default_factory=dict)
-    children: List['ASTNode'] = Field(default_factory=list)
+    children: List[str] = Field(default_factory=list)  # IDs dos nós filhos em ExecutionPlan.ast_nodes
     metadata: Dict[str, Any] = Field(default_factory=dict)
     result_id: Optional[str] = None  # ID do resultado para referência no código gerado
     target_id: Optional[str] = None  # ID do objeto alvo para operações
+    
+    @field_validator('id')
+    @classmethod
+    def _intern_id(cls, value: str) -> str:
+        """Interna ids recebidos do LLM (comparações de id por identidade)"""
+        return sys.intern(value)
 
 class ExecutionPlan(BaseModel):
     """Plano de execução gerado pelo LLM"""
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     description: str
     ast_nodes: List[ASTNode]
     new_parameters: Dict[str, Any] = Field(default_factory=dict)
@@ -71,7 +77,7 @@ class LLMQuery(BaseModel):
     
 class LLMResponse(BaseModel):
     """Resposta estruturada do LLM"""
-    model_config = ConfigDict(json_encoders={datetime: lambda v: v.isoformat()})
+    model_config = DATETIME_ISO_CONFIG
     
     intention_type: str
     execution_plan: Optional[ExecutionPlan] = None
@@ -93,6 +99,3 @@ class ValidationResult(BaseModel):
     is_valid: bool
     errors: List[ValidationError] = Field(default_factory=list)
     warnings: List[str] = Field(default_factory=list)
-    
-# Permite referências circulares nos modelos
-ASTNode.model_rebuild() 
\ No newline at end of file
@@ -1,14 +1,23 @@
-from pydantic import BaseModel, Field, ConfigDict
-from typing import Dict, List, Any, Optional, Set
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
+from typing import Dict, List, Any, Optional, Set, Tuple, ClassVar, Collection, Literal
+from collections import deque
 from enum import Enum
-import uuid
-from datetime import datetime
+import sys
+import numpy as np
+from .base_models import new_id, DATETIME_ISO_CONFIG
+
+# Acima deste número de nós a propagação de nós afetados usa adjacência CSR em NumPy
+CSR_CLOSURE_THRESHOLD = 256
 
 class NodeType(str, Enum):
     PARAMETER = "parameter"
     OPERATION = "operation"
     CONSTRAINT = "constraint"
 
+# Tipo de nó do PIG como Literal: validado pelo pydantic-core sem instanciar o Enum,
+# e comparável diretamente com os valores de NodeType
+PIGNodeTypeValue = Literal["parameter", "operation", "constraint"]
+
 class ParameterType(str, Enum):
     NUMERIC = "numeric"
     STRING = "string"
@@ -18,87 +27,231 @@ class ParameterType(str, Enum):
 
 class PIGNode(BaseModel):
     """Nó do Grafo de Intenção Paramétrica"""
-    model_config = ConfigDict(
-        json_encoders={
-            datetime: lambda v: v.isoformat(),
-            set: list
-        }
-    )
+    # Sets (dependencies/dependents) já saem como arrays JSON pelo serializador nativo do pydantic-core
+    model_config = DATETIME_ISO_CONFIG
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     name: str
-    node_type: NodeType
+    node_type: PIGNodeTypeValue
     value: Any
     description: Optional[str] = None
     dependencies: Set[str] = Field(default_factory=set)
     dependents: Set[str] = Field(default_factory=set)
     metadata: Dict[str, Any] = Field(default_factory=dict)
+    
+    # Campos escalares serializados para JSON (além de dependências e metadados)
+    _SER_FIELDS: ClassVar[Tuple[str, ...]] = ('id', 'name', 'node_type', 'value', 'description')
+    
+    # Revisão incrementada a cada alteração do nó (invalida caches de serialização)
+    _rev: int = PrivateAttr(default=0)
+    
+    # Cache (revisão, dicionário serializado) preenchido pelo PIGManager
+    _serialized: Optional[tuple] = PrivateAttr(default=None)
+    
+    @field_validator('id')
+    @classmethod
+    def _intern_id(cls, value: str) -> str:
+        """Interna ids recebidos (ex.: JSON) para que comparações em sets caiam no teste de identidade"""
+        return sys.intern(value)
+    
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            self._rev += 1
+    
+    def touch(self):
+        """Marca o nó como alterado após mutações in-place (ex.: sets de dependências)"""
+        self._rev += 1
 
 class ParameterNode(PIGNode):
     """Nó de parâmetro no PIG"""
-    node_type: NodeType = NodeType.PARAMETER
+    node_type: PIGNodeTypeValue = NodeType.PARAMETER.value
     parameter_type: ParameterType
     min_value: Optional[float] = None
     max_value: Optional[float] = None
     units: Optional[str] = None
     
+    _SER_FIELDS: ClassVar[Tuple[str, ...]] = PIGNode._SER_FIELDS + (
+        'parameter_type', 'min_value', 'max_value', 'units'
+    )
+    
 class OperationNode(PIGNode):
     """Nó de operação no PIG"""
-    node_type: NodeType = NodeType.OPERATION
+    node_type: PIGNodeTypeValue = NodeType.OPERATION.value
     operation_type: str  # "extrude", "cut", "fillet", etc.
     cadquery_code: Optional[str] = None
     inputs: Dict[str, str] = Field(default_factory=dict)  # nome_input -> node_id
     
+    _SER_FIELDS: ClassVar[Tuple[str, ...]] = PIGNode._SER_FIELDS + (
+        'operation_type', 'cadquery_code', 'inputs'
+    )
+    
 class ParametricIntentionGraph(BaseModel):
     """Grafo de Intenção Paramétrica completo"""
     nodes: Dict[str, PIGNode] = Field(default_factory=dict)
-    execution_order: List[str] = Field(default_factory=list)
     root_nodes: Set[str] = Field(default_factory=set)
+    # Última ordem topológica calculada (cache interno; acessar via get_execution_order)
+    _execution_order: List[str] = PrivateAttr(default_factory=list)
+    # Indica que a topologia mudou desde o último cálculo de _execution_order
+    _order_dirty: bool = PrivateAttr(default=True)
+    # Adjacência de dependentes em formato CSR (ids, índice por id, indptr, indices), reconstruída sob demanda
+    _csr: Optional[tuple] = PrivateAttr(default=None)
+    # Nós afetados por cada parâmetro, já em ordem topológica (válido enquanto a topologia não muda)
+    _affected_order: Dict[str, Tuple[str, ...]] = PrivateAttr(default_factory=dict)
+    # Nome do parâmetro em minúsculas -> id do nó, construído sob demanda e mantido em add_node(s)
+    _name_index: Optional[Dict[str, str]] = PrivateAttr(default=None)
+    
+    def mark_topology_dirty(self):
+        """Invalida ordem de execução e adjacência em cache após mudança de topologia"""
+        self._order_dirty = True
+        self._csr = None
+        self._affected_order.clear()
+    
+    def clear(self):
+        """Remove todos os nós do grafo"""
+        self.nodes.clear()
+        self._execution_order = []
+        self.root_nodes.clear()
+        self._name_index = None
+        self.mark_topology_dirty()
+    
+    def _index_name(self, node: PIGNode):
+        """Registra o nome de um nó de parâmetro no índice (mantém o primeiro nó com o nome)"""
+        if self._name_index is not None and node.node_type == NodeType.PARAMETER:
+            self._name_index.setdefault(node.name.lower(), node.id)
     
     def add_node(self, node: PIGNode) -> str:
         """Adiciona um nó ao grafo"""
         self.nodes[node.id] = node
+        self._index_name(node)
+        self.mark_topology_dirty()
         if not node.dependencies:
             self.root_nodes.add(node.id)
         return node.id
     
+    def add_nodes(self, nodes: List[PIGNode]):
+        """Adiciona vários nós ao grafo invalidando os caches de topologia uma única vez"""
+        for node in nodes:
+            self.nodes[node.id] = node
+            self._index_name(node)
+            if not node.dependencies:
+                self.root_nodes.add(node.id)
+        if nodes:
+            self.mark_topology_dirty()
+    
     def add_dependency(self, dependent_id: str, dependency_id: str):
         """Adiciona uma dependência entre nós"""
         if dependent_id in self.nodes and dependency_id in self.nodes:
-            self.nodes[dependent_id].dependencies.add(dependency_id)
-            self.nodes[dependency_id].dependents.add(dependent_id)
+            # Arestas guardam o próprio objeto id dos nós (comparação por identidade nos sets)
+            dependent = self.nodes[dependent_id]
+            dependency = self.nodes[dependency_id]
+            dependent.dependencies.add(dependency.id)
+            dependency.dependents.add(dependent.id)
+            dependent.touch()
+            dependency.touch()
+            self.mark_topology_dirty()
             # Remove da lista de root nodes se agora tem dependências
             if dependent_id in self.root_nodes and self.nodes[dependent_id].dependencies:
                 self.root_nodes.remove(dependent_id)
     
+    def add_dependencies_bulk(self, edges: List[Tuple[str, str]]):
+        """Adiciona várias dependências (dependent_id, dependency_id) em lote"""
+        touched = set()
+        for dependent_id, dependency_id in edges:
+            if dependent_id in self.nodes and dependency_id in self.nodes:
+                dependent = self.nodes[dependent_id]
+                dependency = self.nodes[dependency_id]
+                dependent.dependencies.add(dependency.id)
+                dependency.dependents.add(dependent.id)
+                self.root_nodes.discard(dependent_id)
+                touched.add(dependent_id)
+                touched.add(dependency_id)
+        
+        for node_id in touched:
+            self.nodes[node_id].touch()
+        if touched:
+            self.mark_topology_dirty()
+    
+    def bulk_add(self, parameter_nodes: List['ParameterNode'], operation_nodes: List['OperationNode']):
+        """
+        Carrega parâmetros e operações de uma só vez (ex.: restauração de checkpoint).
+        As dependências vêm dos inputs das operações; a ordem de execução fica a cargo do chamador.
+        """
+        self.add_nodes([*parameter_nodes, *operation_nodes])
+        self.add_dependencies_bulk([
+            (operation.id, input_id)
+            for operation in operation_nodes
+            for input_id in operation.inputs.values()
+        ])
+    
     def get_execution_order(self) -> List[str]:
-        """Calcula a ordem de execução topológica dos nós"""
-        visited = set()
-        temp_visited = set()
+        """
+        Calcula a ordem de execução topológica dos nós (algoritmo de Kahn, sem recursão).
+        Enquanto a topologia não muda, reaproveita a ordem já calculada; retorna sempre
+        uma cópia para que o chamador não altere o cache.
+        """
+        if not self._order_dirty:
+            return list(self._execution_order)
+        
+        if len(self.nodes) > CSR_CLOSURE_THRESHOLD:
+            order = self._dense_topological_order()
+        else:
+            order = self._topological_order(self.nodes)
+        self._execution_order = order
+        self._order_dirty = False
+        return list(order)
+    
+    def _dense_topological_order(self) -> List[str]:
+        """Kahn sobre índices inteiros da adjacência CSR (grafos grandes, sem hashing de ids no laço)"""
+        ids, _, indptr, indices = self._get_csr()
+        indegree = np.bincount(indices, minlength=len(ids)).tolist()
+        ptr = indptr.tolist()
+        adjacency = indices.tolist()
+        
+        queue = deque(i for i, degree in enumerate(indegree) if degree == 0)
         order = []
+        while queue:
+            i = queue.popleft()
+            order.append(i)
+            for j in adjacency[ptr[i]:ptr[i + 1]]:
+                indegree[j] -= 1
+                if indegree[j] == 0:
+                    queue.append(j)
         
-        def visit(node_id: str):
-            if node_id in temp_visited:
-                raise ValueError(f"Dependência circular detectada envolvendo {node_id}")
-            if node_id in visited:
-                return
-                
-            temp_visited.add(node_id)
-            
-            # Visita todas as dependências primeiro
-            for dep_id in self.nodes[node_id].dependencies:
-                visit(dep_id)
-                
-            temp_visited.remove(node_id)
-            visited.add(node_id)
+        if len(order) != len(ids):
+            remaining = next(i for i, degree in enumerate(indegree) if degree > 0)
+            raise ValueError(f"Dependência circular detectada envolvendo {ids[remaining]}")
+        
+        return [ids[i] for i in order]
+    
+    def _topological_order(self, node_ids: Collection[str]) -> List[str]:
+        """
+        Ordena topologicamente os nós informados (dict ou set de ids), considerando
+        apenas as arestas entre eles.
+        """
+        nodes = self.nodes
+        
+        # Grau de entrada: dependências que pertencem ao conjunto ordenado
+        indegree = {
+            node_id: sum(1 for dep_id in nodes[node_id].dependencies if dep_id in node_ids)
+            for node_id in node_ids
+        }
+        queue = deque(node_id for node_id, degree in indegree.items() if degree == 0)
+        order = []
+        
+        while queue:
+            node_id = queue.popleft()
             order.append(node_id)
+            for dependent_id in nodes[node_id].dependents:
+                if dependent_id in indegree:
+                    indegree[dependent_id] -= 1
+                    if indegree[dependent_id] == 0:
+                        queue.append(dependent_id)
+        
+        if len(order) != len(indegree):
+            remaining = next(node_id for node_id, degree in indegree.items() if degree > 0)
+            raise ValueError(f"Dependência circular detectada envolvendo {remaining}")
         
-        # Visita todos os nós
-        for node_id in self.nodes:
-            if node_id not in visited:
-                visit(node_id)
-                
-        self.execution_order = order
         return order
     
     def update_parameter(self, node_id: str, new_value: Any) -> List[str]:
@@ -108,24 +261,65 @@ class ParametricIntentionGraph(BaseModel):
             
         self.nodes[node_id].value = new_value
         
-        # Encontra todos os nós dependentes que precisam ser recalculados
-        affected_nodes = set()
-        to_visit = [node_id]
+        # Nós dependentes a recalcular, em ordem topológica (reaproveitados entre atualizações)
+        affected = self._affected_order.get(node_id)
+        if affected is None:
+            affected = self._affected_order[node_id] = tuple(
+                self._topological_order(self._affected_closure(node_id))
+            )
+        return list(affected)
+    
+    def _affected_closure(self, node_id: str) -> Set[str]:
+        """Retorna o fecho transitivo de dependentes de um nó"""
+        if len(self.nodes) <= CSR_CLOSURE_THRESHOLD:
+            affected_nodes = set()
+            to_visit = [node_id]
+            
+            while to_visit:
+                current = to_visit.pop()
+                for dependent in self.nodes[current].dependents:
+                    if dependent not in affected_nodes:
+                        affected_nodes.add(dependent)
+                        to_visit.append(dependent)
+            
+            return affected_nodes
         
-        while to_visit:
-            current = to_visit.pop()
-            for dependent in self.nodes[current].dependents:
-                if dependent not in affected_nodes:
-                    affected_nodes.add(dependent)
-                    to_visit.append(dependent)
+        ids, index, indptr, indices = self._get_csr()
+        reached = np.zeros(len(ids), dtype=bool)
+        frontier = np.array([index[node_id]], dtype=np.int32)
         
-        # Retorna em ordem topológica
-        execution_order = self.get_execution_order()
-        return [node_id for node_id in execution_order if node_id in affected_nodes]
+        # Propagação por níveis: cada iteração expande toda a fronteira em C
+        while frontier.size:
+            starts = indptr[frontier]
+            lengths = indptr[frontier + 1] - starts
+            total = int(lengths.sum())
+            if total == 0:
+                break
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+            neighbors = np.unique(indices[offsets])
+            frontier = neighbors[~reached[neighbors]]
+            reached[frontier] = True
+        
+        return {ids[i] for i in np.flatnonzero(reached)}
+    
+    def _get_csr(self) -> tuple:
+        """Constrói (ou reutiliza) a adjacência de dependentes em formato CSR"""
+        if self._csr is None:
+            ids = list(self.nodes)
+            index = {node_id: i for i, node_id in enumerate(ids)}
+            indptr = np.zeros(len(ids) + 1, dtype=np.int32)
+            flat = []
+            for i, node_id in enumerate(ids):
+                dependents = self.nodes[node_id].dependents
+                flat.extend(index[dep_id] for dep_id in dependents)
+                indptr[i + 1] = indptr[i] + len(dependents)
+            self._csr = (ids, index, indptr, np.array(flat, dtype=np.int32))
+        return self._csr
     
     def find_parameter_by_name(self, name: str) -> Optional[str]:
-        """Encontra ID do nó por nome do parâmetro"""
-        for node_id, node in self.nodes.items():
-            if node.name.lower() == name.lower() and node.node_type == NodeType.PARAMETER:
-                return node_id
-        return None 
\ No newline at end of file
+        """Encontra ID do nó por nome do parâmetro (busca no índice de nomes)"""
+        if self._name_index is None:
+            self._name_index = {}
+            for node in self.nodes.values():
+                self._index_name(node)
+        return self._name_index.get(name.lower()) 
\ No newline at end of file
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import time
+
+from src.core import planning_module
+from src.core.planning_module import PlanningModule, _StreamingJsonScanner, _normalize_request, _try_deterministic_plan
+
+
+# Plano com cilindro sem 'radius': reprovado na validação
+_INVALID_PLAN_RESPONSE = json.dumps({
+    "intention_type": "create_new_model",
+    "response_text": "Criando cilindro",
+    "execution_plan": {
+        "description": "cilindro",
+        "ast_nodes": [{"id": "n1", "node_type": "operation", "operation": "cylinder", "parameters": {"height": 5}}],
+    },
+})
+
+_QUERY = {"user_request": "faça um furo no topo", "current_model_state": {"objects": 1}}
+
+
+def _ollama_planner(tmp_path, monkeypatch, responses):
+    """PlanningModule em modo Ollama (sem rede) cujo LLM devolve as respostas dadas, em ordem"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_PROVIDER", "ollama")
+    monkeypatch.setenv("OLLAMA_MODEL", "modelo")
+    monkeypatch.setitem(planning_module._OLLAMA_TAGS_CACHE, "http://localhost:11434", (time.monotonic(), ["modelo"]))
+    monkeypatch.setattr(PlanningModule, "_preload_ollama_model", lambda self: None)
+    planner = PlanningModule()
+    calls = []
+
+    async def fake_call_llm(prompt, context="plan_generation", use_cache=True):
+        calls.append((context, use_cache))
+        return responses[min(len(calls), len(responses)) - 1]
+
+    planner._call_llm = fake_call_llm
+    return planner, calls
+
+
+def test_normalize_request_folds_case_and_whitespace():
+    assert _normalize_request("  Crie um  Cilindro\tcom raio 10 ") == "crie um cilindro com raio 10"
+
+
+def test_normalize_request_keeps_signs_and_operators():
+    assert _normalize_request("mova o furo -10 mm em X") != _normalize_request("mova o furo 10 mm em X")
+    assert _normalize_request("1/2") != _normalize_request("1 2")
+
+
+def test_deterministic_box_maps_depth_to_height():
+    response = _try_deterministic_plan("crie uma caixa largura 10 comprimento 20 profundidade 5")
+    assert response is not None
+    assert response.execution_plan.parameters == {"box_length": 20.0, "box_width": 10.0, "box_height": 5.0}
+
+
+def test_deterministic_box_with_repeated_dimension_defers_to_llm():
+    request = "crie uma caixa com largura 10, comprimento 20, altura 3 e profundidade 5"
+    assert _try_deterministic_plan(request) is None
+
+
+def test_deterministic_box_with_all_dimensions():
+    response = _try_deterministic_plan("crie uma caixa com largura 10, comprimento 20 e altura 3")
+    assert response.execution_plan.parameters == {"box_length": 20.0, "box_width": 10.0, "box_height": 3.0}
+
+
+def _scan(chunks):
+    scanner = _StreamingJsonScanner()
+    for chunk in chunks:
+        completed = scanner.feed(chunk)
+        if completed is not None:
+            return completed
+    return None
+
+
+def test_streaming_scanner_skips_think_block_and_braces_in_strings():
+    chunks = ['<thi', 'nk>talvez {} ou {"x"', '</th', 'ink>\n{"a": "b\\', '"}"', '} resto']
+    assert _scan(chunks) == '{"a": "b\\"}"}'
+
+
+def test_streaming_scanner_waits_for_nested_objects():
+    assert _scan(['{"a": {"b": 1', '}', '}']) == '{"a": {"b": 1}}'
+    assert _scan(['{"a": 1']) is None
+
+
+def test_invalid_plan_after_failed_auto_correction_is_not_cached(tmp_path, monkeypatch):
+    planner, calls = _ollama_planner(tmp_path, monkeypatch, [_INVALID_PLAN_RESPONSE])
+
+    asyncio.run(planner.generate_plan(dict(_QUERY)))
+    asyncio.run(planner.generate_plan(dict(_QUERY)))
+
+    assert not planner._plan_cache
+    assert not planner._response_cache
+    assert [context for context, _ in calls].count("plan_generation") == 2
+
+
+def test_error_correction_bypasses_response_cache(tmp_path, monkeypatch):
+    planner, calls = _ollama_planner(tmp_path, monkeypatch, [_INVALID_PLAN_RESPONSE])
+    query = {
+        "request_type": "error_correction",
+        "original_plan": {"description": "cilindro", "ast_nodes": []},
+        "error_message": "erro",
+        "error_traceback": "",
+    }
+
+    asyncio.run(planner.generate_plan(dict(query)))
+    asyncio.run(planner.generate_plan(dict(query)))
+
+    assert all(not use_cache for _, use_cache in calls)
+    assert not planner._response_cache
+
+
+def test_deterministic_cone():
+    response = _try_deterministic_plan("crie um cone com diâmetro 10 e altura 20")
+    assert response.execution_plan.parameters == {"cone_height": 20.0, "cone_radius": 5.0}
+    assert "makeCone(cone_radius, 0, cone_height)" in response.execution_plan.cadquery_code